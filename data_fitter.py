@@ -9,7 +9,8 @@ Created on Wed Mar 15 2023
 # Library import
 import numpy as np
 from scipy.optimize import curve_fit
-from scipy.stats import chi2
+from scipy.stats import chi2, norm
+from concurrent.futures import ProcessPoolExecutor
 
 # %% Fit model definition
 # Gyro model definition
@@ -33,11 +34,82 @@ def gyro_model(x_val, param_a_cap, param_b_cap, param_a, param_b):
     array
         Gyro model.
     """
+    # Shared model terms
+    x_pow_a, _, x_exp = gyro_terms(x_val, param_b_cap, param_a, param_b)
+
     # Return gyro model
-    return (
-        param_a_cap
-        * (x_val**param_a)
-        * (1 - np.exp(-param_b_cap * (x_val ** (-param_b))))
+    return param_a_cap * x_pow_a * (1 - x_exp)
+
+
+# Gyro model shared terms
+def gyro_terms(x_val, param_b_cap, param_a, param_b):
+    """
+    Parameters
+    ----------
+    x_val : array
+        Gyro model x value array.
+    param_b_cap : float
+        Fit param B.
+    param_a : float
+        Fit param a.
+    param_b : float
+        Fit param b.
+
+    Returns
+    -------
+    x_pow_a : array
+        Power term x**a.
+    x_pow_b : array
+        Power term x**-b.
+    x_exp : array
+        Absorption term exp(-B * x**-b).
+    """
+    # Power and exp terms, computed once for the model and its Jacobian
+    x_pow_a, x_pow_b = x_val**param_a, x_val ** (-param_b)
+
+    # Return shared terms, overflow only occurs on rejected trial steps
+    with np.errstate(over="ignore"):
+        return (x_pow_a, x_pow_b, np.exp(-param_b_cap * x_pow_b))
+
+
+# Gyro model Jacobian
+def gyro_jacobian(x_val, param_a_cap, param_b_cap, param_a, param_b):
+    """
+    Parameters
+    ----------
+    x_val : array
+        Gyro model x value array.
+    param_a_cap : float
+        Fit param A.
+    param_b_cap : float
+        Fit param B.
+    param_a : float
+        Fit param a.
+    param_b : float
+        Fit param b.
+
+    Returns
+    -------
+    array
+        Partial derivatives over A, B, a, b of shape (x, 4).
+    """
+    # Shared model terms
+    x_pow_a, x_pow_b, x_exp = gyro_terms(x_val, param_b_cap, param_a, param_b)
+    x_log, d_a_cap, d_exp = (
+        np.log(x_val),
+        x_pow_a * (1 - x_exp),
+        param_a_cap * x_pow_a * x_exp * x_pow_b,
+    )
+
+    # Return gyro model Jacobian
+    return np.stack(
+        [
+            d_a_cap,
+            d_exp,
+            param_a_cap * d_a_cap * x_log,
+            -param_b_cap * d_exp * x_log,
+        ],
+        axis=-1,
     )
 
 
@@ -63,6 +135,30 @@ def plas_model(x_val, param_c, param_k):
     return param_c * (x_val**param_k)
 
 
+# Plas model Jacobian
+def plas_jacobian(x_val, param_c, param_k):
+    """
+    Parameters
+    ----------
+    x_val : array
+        Plasma model x value array.
+    param_c : float
+        Fit param c.
+    param_k : float
+        Fit param k.
+
+    Returns
+    -------
+    array
+        Partial derivatives over c, k of shape (x, 2).
+    """
+    # Shared power term
+    x_pow_k = x_val**param_k
+
+    # Return plas model Jacobian
+    return np.stack([x_pow_k, param_c * x_pow_k * np.log(x_val)], axis=-1)
+
+
 # %% Fitted function result label generator
 def fit_label(gyro_param, plas_param):
     """
@@ -101,9 +197,137 @@ def fit_label(gyro_param, plas_param):
     return (label_gyro, label_plas)
 
 
+# %% Log-space initial guess
+# Masked log-log line fit of many spectra
+def log_line(data_freq, data_flux, mask):
+    """
+    Parameters
+    ----------
+    data_freq : array
+        Freq array of shape (spectra, freq).
+    data_flux : array
+        Flux array of shape (spectra, freq).
+    mask : array
+        Points used per spectrum, non-positive flux is always skipped.
+
+    Returns
+    -------
+    slope : array
+        Log-log slope per spectrum, NaN with fewer than two points.
+    intercept : array
+        Log-log intercept per spectrum.
+    """
+    # Usable points and their logs
+    with np.errstate(all="ignore"):
+        mask = mask & (data_flux > 0) & (data_freq > 0)
+        log_x = np.where(mask, np.log(np.where(mask, data_freq, 1)), 0)
+        log_y = np.where(mask, np.log(np.where(mask, data_flux, 1)), 0)
+
+        # Closed-form least squares from the masked sums
+        num, sum_x, sum_y = (
+            np.sum(mask, axis=-1),
+            np.sum(log_x, axis=-1),
+            np.sum(log_y, axis=-1),
+        )
+        slope = (num * np.sum(log_x * log_y, axis=-1) - sum_x * sum_y) / (
+            num * np.sum(log_x**2, axis=-1) - sum_x**2
+        )
+        slope = np.where(num >= 2, slope, np.nan)
+
+    # Return slope and intercept
+    return (slope, (sum_y - slope * sum_x) / np.maximum(num, 1))
+
+
+# Plas model initial guess
+def plas_guess(data_freq, data_flux, cut=None):
+    """
+    Parameters
+    ----------
+    data_freq : array
+        Freq array of shape (freq,) or (spectra, freq).
+    data_flux : array
+        Flux array of shape (freq,) or (spectra, freq).
+    cut : float, optional
+        Use only freq below the cut. The default is None, all freq.
+
+    Returns
+    -------
+    p0 : array
+        Initial c, k of shape (spectra, 2), all ones where the spectrum
+        has fewer than two positive points.
+    """
+    # Stacked arrays and used points
+    data_flux = np.atleast_2d(np.asarray(data_flux, dtype=np.float64))
+    data_freq = np.broadcast_to(
+        np.asarray(data_freq, dtype=np.float64), data_flux.shape
+    )
+    mask = np.isfinite(data_flux) & (
+        True if cut is None else data_freq < cut
+    )
+
+    # Exact power law in log-log space - log y = log c + k log x
+    slope, intercept = log_line(data_freq, data_flux, mask)
+    p0 = np.stack([np.exp(intercept), slope], axis=-1)
+
+    # Return guess, default ones where the line fit failed
+    return np.where(np.isfinite(p0).all(axis=-1, keepdims=True), p0, 1.0)
+
+
+# Gyro model initial guess
+def gyro_guess(data_freq, data_flux):
+    """
+    Parameters
+    ----------
+    data_freq : array
+        Freq array of shape (freq,) or (spectra, freq).
+    data_flux : array
+        Flux array of shape (freq,) or (spectra, freq).
+
+    Returns
+    -------
+    p0 : array
+        Initial A, B, a, b of shape (spectra, 4), all ones where either
+        side of the spectral peak has fewer than two positive points.
+    """
+    # Stacked arrays and the spectral peak freq
+    data_flux = np.atleast_2d(np.asarray(data_flux, dtype=np.float64))
+    data_freq = np.broadcast_to(
+        np.asarray(data_freq, dtype=np.float64), data_flux.shape
+    )
+    finite = np.isfinite(data_flux)
+    peak = np.take_along_axis(
+        data_freq,
+        np.argmax(np.where(finite, data_flux, -np.inf), axis=-1)[:, None],
+        axis=-1,
+    )
+
+    # Low freq asymptote - y = A x**a
+    slope_low, log_a_cap = log_line(
+        data_freq, data_flux, finite & (data_freq <= peak)
+    )
+    # High freq asymptote - y = A B x**(a - b)
+    slope_high, log_ab_cap = log_line(
+        data_freq, data_flux, finite & (data_freq >= peak)
+    )
+
+    # Asymptote params, keep b positive so the model turns over
+    p0 = np.stack(
+        [
+            np.exp(log_a_cap),
+            np.exp(log_ab_cap - log_a_cap),
+            slope_low,
+            np.maximum(slope_low - slope_high, 0.1),
+        ],
+        axis=-1,
+    )
+
+    # Return guess, default ones where an asymptote fit failed
+    return np.where(np.isfinite(p0).all(axis=-1, keepdims=True), p0, 1.0)
+
+
 # %% Gyro fitter
 # Gyro fitter function
-def gyro_fitter(data_freq, data_flux, title):
+def gyro_fitter(data_freq, data_flux, title, verbose=True, p0=None):
     """
     Parameters
     ----------
@@ -113,6 +337,11 @@ def gyro_fitter(data_freq, data_flux, title):
         Combined flux data array.
     title : string
         Additional title for plot customization.
+    verbose : bool, optional
+        Print the fit results. The default is True.
+    p0 : array, optional
+        Initial parameter guess, such as a neighbouring fit. The default is
+        None, the log-space guess with a retry from all ones.
 
     Returns
     -------
@@ -125,17 +354,26 @@ def gyro_fitter(data_freq, data_flux, title):
     chi_p_val : float
         The p-value from the chi-sqaured test.
     """
-    # Generate filtered data
+    # Generate filtered data, promoted to float64 for the fit
     data_x, data_y = (
-        data_freq,
-        data_flux,
+        np.asarray(data_freq, dtype=np.float64),
+        np.asarray(data_flux, dtype=np.float64),
     )
 
-    # Iniitial parameter guess
-    param_guess = [1, 1, 1, 1]  # param_A, param_B, param_a, param_b
+    # Iniitial parameter guess - param_A, param_B, param_a, param_b
+    param_guess = gyro_guess(data_x, data_y)[0] if p0 is None else p0
 
-    # Curve fit results
-    params, cov = curve_fit(gyro_model, data_x, data_y, p0=param_guess)
+    # Curve fit results, retry from all ones if the guess fails
+    try:
+        params, cov = curve_fit(
+            gyro_model, data_x, data_y, p0=param_guess, jac=gyro_jacobian
+        )
+    except RuntimeError:
+        if p0 is not None:
+            raise
+        params, cov = curve_fit(
+            gyro_model, data_x, data_y, p0=[1, 1, 1, 1], jac=gyro_jacobian
+        )
 
     # Residuals generator
     # Get fitted model
@@ -153,25 +391,26 @@ def gyro_fitter(data_freq, data_flux, title):
     chi_p_val = 1 - chi2.cdf(chi_sqr, chi_dof)
 
     # Results print out
-    # Gyro fitter result title
-    print()
-    print(f"{'Gyro fitter results ' + title:<20}")
-    print("=" * 30)
-    # Print fit parameters
-    print(f"{'Gyro fitter fitted parameters':<15}")
-    print(f"{'A:':<20}{params[0]:>10.5g}")
-    print(f"{'B:':<20}{params[1]:>10.5g}")
-    print(f"{'a:':<20}{params[2]:>10.5g}")
-    print(f"{'b:':<20}{params[3]:>10.5g}")
-    print(f"{'Low freq slope:':<20}{params[2]:>10.5g}")
-    print(f"{'High freq slope:':<20}{params[2]-params[3]:>10.5g}")
-    print()
-    # Print chi2 results
-    print(f"{'Chi-square test result':<20}")
-    print(f"{'Chi-square:':<20}{chi_sqr:>10.5g}")
-    print(f"{'p-value:':<20}{chi_p_val:>10.5g}")
-    print("=" * 30)
-    print()
+    if verbose:
+        # Gyro fitter result title
+        print()
+        print(f"{'Gyro fitter results ' + title:<20}")
+        print("=" * 30)
+        # Print fit parameters
+        print(f"{'Gyro fitter fitted parameters':<15}")
+        print(f"{'A:':<20}{params[0]:>10.5g}")
+        print(f"{'B:':<20}{params[1]:>10.5g}")
+        print(f"{'a:':<20}{params[2]:>10.5g}")
+        print(f"{'b:':<20}{params[3]:>10.5g}")
+        print(f"{'Low freq slope:':<20}{params[2]:>10.5g}")
+        print(f"{'High freq slope:':<20}{params[2]-params[3]:>10.5g}")
+        print()
+        # Print chi2 results
+        print(f"{'Chi-square test result':<20}")
+        print(f"{'Chi-square:':<20}{chi_sqr:>10.5g}")
+        print(f"{'p-value:':<20}{chi_p_val:>10.5g}")
+        print("=" * 30)
+        print()
 
     # Function return
     return (params, cov, chi_sqr, chi_p_val)
@@ -179,7 +418,7 @@ def gyro_fitter(data_freq, data_flux, title):
 
 # %% Plas fitter
 # Plas fitter function
-def plas_fitter(data_x, data_y, cut):
+def plas_fitter(data_x, data_y, cut, verbose=True, p0=None):
     """
     Parameters
     ----------
@@ -189,6 +428,11 @@ def plas_fitter(data_x, data_y, cut):
         Combined flux data array.
     cut : float
         Cut-off point for different fits.
+    verbose : bool, optional
+        Print the fit results. The default is True.
+    p0 : array, optional
+        Initial parameter guess, such as a neighbouring fit. The default is
+        None, the log-space guess.
 
     Returns
     -------
@@ -201,17 +445,21 @@ def plas_fitter(data_x, data_y, cut):
     chi_p_val : float
         The p-value from the chi-sqaured test.
     """
-    # Generate filtered data
+    # Generate filtered data, promoted to float64 for the fit
     data_x, data_y = (
-        data_x[data_x < cut],
-        data_y[data_x < cut],
+        np.asarray(data_x[data_x < cut], dtype=np.float64),
+        np.asarray(data_y[data_x < cut], dtype=np.float64),
     )
 
     # Iniitial parameter guess
-    param_guess = [1, 1]  # param_c, param_k
+    param_guess = (
+        plas_guess(data_x, data_y)[0] if p0 is None else p0
+    )  # param_c, param_k
 
     # Curve fit results
-    params, cov = curve_fit(plas_model, data_x, data_y, p0=param_guess)
+    params, cov = curve_fit(
+        plas_model, data_x, data_y, p0=param_guess, jac=plas_jacobian
+    )
 
     # Residuals generator
     # Get fitted model
@@ -229,21 +477,22 @@ def plas_fitter(data_x, data_y, cut):
     chi_p_val = 1 - chi2.cdf(chi_sqr, chi_dof)
 
     # Results print out
-    # Gyro fitter result title
-    print()
-    print(f"{'Plas fitter results':<20}")
-    print("=" * 30)
-    # Print fit parameters
-    print(f"{'Plas fitter fitted parameters':<20}")
-    print(f"{'c:':<20}{params[0]:>10.5g}")
-    print(f"{'k:':<20}{params[1]:>10.5g}")
-    print()
-    # Print chi2 results
-    print(f"{'Chi-square test result':<20}")
-    print(f"{'Chi-square:':<20}{chi_sqr:>10.5g}")
-    print(f"{'p-value:':<20}{chi_p_val:>10.5g}")
-    print("=" * 30)
-    print()
+    if verbose:
+        # Gyro fitter result title
+        print()
+        print(f"{'Plas fitter results':<20}")
+        print("=" * 30)
+        # Print fit parameters
+        print(f"{'Plas fitter fitted parameters':<20}")
+        print(f"{'c:':<20}{params[0]:>10.5g}")
+        print(f"{'k:':<20}{params[1]:>10.5g}")
+        print()
+        # Print chi2 results
+        print(f"{'Chi-square test result':<20}")
+        print(f"{'Chi-square:':<20}{chi_sqr:>10.5g}")
+        print(f"{'p-value:':<20}{chi_p_val:>10.5g}")
+        print("=" * 30)
+        print()
 
     # Function return
     return (params, cov, chi_sqr, chi_p_val)
@@ -283,3 +532,664 @@ def gyro_pass(data_freq, data_flux, cut, plas_param):
 
     # Return denoised result
     return data_y_gyro
+
+
+# %% Time-resolved fitter
+# Fit chain of one spectrum
+def spectrum_fitter(data_freq, data_flux, cut, p0=None):
+    """
+    Parameters
+    ----------
+    data_freq : array
+        Combined freq data array.
+    data_flux : array
+        Combined flux data array, NaN channels are skipped.
+    cut : float
+        Cut-off point for different fits.
+    p0 : array, optional
+        Initial guess of A, B, a, b, c, k, a failed fit is retried once
+        without it. The default is None, the log-space guess.
+
+    Returns
+    -------
+    params : array
+        Denoised gyro params A, B, a, b and plas params c, k, NaN if the
+        fit failed.
+    chi_sqr : array
+        Chi-squared values of the gyro and plas fits.
+    """
+    # Keep recorded channels only
+    keep = np.isfinite(data_flux)
+    data_freq, data_flux = data_freq[keep], data_flux[keep]
+
+    # Plas fit, then gyro fit of the plas denoised spectrum
+    try:
+        results_plas = plas_fitter(
+            data_freq,
+            data_flux,
+            cut,
+            verbose=False,
+            p0=None if p0 is None else p0[4:],
+        )
+        results_gyro = gyro_fitter(
+            data_freq,
+            gyro_pass(data_freq, data_flux, cut, results_plas[0]),
+            "",
+            verbose=False,
+            p0=None if p0 is None else p0[:4],
+        )
+    except (RuntimeError, ValueError, TypeError):
+        # Retry a failed warm start once from the cold guess
+        if p0 is not None:
+            return spectrum_fitter(data_freq, data_flux, cut)
+        # Failed or underdetermined fits are marked as NaN
+        return (np.full(6, np.nan), np.full(2, np.nan))
+
+    # Return fit params and chi2
+    return (
+        np.concatenate([results_gyro[0], results_plas[0]]),
+        np.array([results_gyro[2], results_plas[2]]),
+    )
+
+
+# Warm started fits of one time chunk
+def time_chunk(args):
+    """
+    Parameters
+    ----------
+    args : tuple
+        Freq array, chunk of spectra, cut-off freq, and initial guess.
+
+    Returns
+    -------
+    params : array
+        Fit params of shape (spectra, 6).
+    chi_sqr : array
+        Chi-squared values of shape (spectra, 2).
+    """
+    # Local variable repo
+    data_freq, data_flux, cut, p0 = args
+    params, chi_sqr = (
+        np.full((len(data_flux), 6), np.nan),
+        np.full((len(data_flux), 2), np.nan),
+    )
+
+    # Fit in time order, each fit starts from the last converged one
+    for i, flux in enumerate(data_flux):
+        params[i], chi_sqr[i] = spectrum_fitter(data_freq, flux, cut, p0)
+        if np.all(np.isfinite(params[i])):
+            p0 = params[i]
+
+    # Return chunk results
+    return (params, chi_sqr)
+
+
+# Time-resolved parallel fitter
+def time_fitter(
+    data_times, data_freq, data_flux, cut, workers=None, chunk_size=64
+):
+    """
+    Parameters
+    ----------
+    data_times : array
+        Spectrum timestamps, such as from spectra_collector.
+    data_freq : array
+        Combined freq data array.
+    data_flux : array
+        Combined spectra of shape (times, freq).
+    cut : float
+        Cut-off point for different fits.
+    workers : integer, optional
+        Number of worker processes. The default is None, one per core.
+    chunk_size : integer, optional
+        Consecutive spectra per task, warm starts run within a chunk. The
+        default is 64.
+
+    Returns
+    -------
+    data_times : array
+        Spectrum timestamps.
+    params : array
+        Time series of A, B, a, b, c, k of shape (times, 6), NaN where the
+        fit failed.
+    chi_sqr : array
+        Time series of gyro and plas chi-squared of shape (times, 2).
+    """
+    # Contiguous time chunks, each chunk starts from the default guess
+    data_freq = np.asarray(data_freq, dtype=np.float64)
+    data_flux = np.asarray(data_flux, dtype=np.float64)
+    args = [
+        (data_freq, data_flux[i : i + chunk_size], cut, None)
+        for i in range(0, len(data_flux), chunk_size)
+    ]
+
+    # Fit chunks on a process pool
+    results = [(np.empty((0, 6)), np.empty((0, 2)))]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results.extend(pool.map(time_chunk, args))
+
+    # Return time series of params and chi2
+    return (
+        data_times,
+        np.concatenate([res[0] for res in results]),
+        np.concatenate([res[1] for res in results]),
+    )
+
+
+# %% Batched fitter
+# Model, Jacobian, and initial guess repo of the batched fitter
+BATCH_MODELS = {
+    "gyro": (gyro_model, gyro_jacobian, gyro_guess),
+    "plas": (plas_model, plas_jacobian, plas_guess),
+}
+
+
+# Batched Levenberg-Marquardt solver
+def batch_solver(model, data_freq, data_flux, weights, params, max_iter, tol):
+    """
+    Parameters
+    ----------
+    model : string
+        Fit model, "gyro" or "plas".
+    data_freq : array
+        Freq array of shape (spectra, freq).
+    data_flux : array
+        Flux array of shape (spectra, freq), finite where weighted.
+    weights : array
+        Residual weights of shape (spectra, freq), zero drops a point.
+    params : array
+        Initial params of shape (spectra, params), updated in place.
+    max_iter : integer
+        Maximum iterations.
+    tol : float
+        Relative cost and step tolerance.
+
+    Returns
+    -------
+    params : array
+        Fitted params of shape (spectra, params).
+    fit_cost : array
+        Weighted residual sum of squares per spectrum.
+    converged : array
+        Convergence mask per spectrum.
+    """
+    # Model functions
+    func, jac, _ = BATCH_MODELS[model]
+
+    # Weighted residual cost of a subset of spectra
+    def cost(idx, param):
+        resid = weights[idx] * (
+            data_flux[idx] - func(data_freq[idx], *param.T[..., None])
+        )
+        resid = np.where(weights[idx] > 0, resid, 0)
+        return np.sum(resid**2, axis=1), resid
+
+    # Per spectrum damping, convergence, and active masks
+    damping = np.full(len(data_flux), 1e-3)
+    converged = np.zeros(len(data_flux), dtype=bool)
+    active = np.ones(len(data_flux), dtype=bool)
+    with np.errstate(all="ignore"):
+        fit_cost, fit_resid = cost(slice(None), params)
+
+    # Levenberg-Marquardt steps on the active spectra only
+    for _ in range(max_iter):
+        idx = np.flatnonzero(active)
+        if not len(idx):
+            break
+
+        # Weighted Jacobian and normal equations of every active spectrum
+        with np.errstate(all="ignore"):
+            fit_jac = weights[idx, :, None] * jac(
+                data_freq[idx], *params[idx].T[..., None]
+            )
+        fit_jac[weights[idx] == 0] = 0
+        jtj = np.einsum("nij,nik->njk", fit_jac, fit_jac)
+        jtr = np.einsum("nij,ni->nj", fit_jac, fit_resid[idx])
+
+        # Marquardt scaled damping, solved as small stacked systems
+        diag = np.einsum("njj->nj", jtj)
+        lhs = jtj + (damping[idx, None] * np.maximum(diag, 1e-12))[
+            ..., None
+        ] * np.eye(params.shape[1])
+        with np.errstate(all="ignore"):
+            try:
+                step = np.linalg.solve(lhs, jtr[..., None])[..., 0]
+            except np.linalg.LinAlgError:
+                # Singular systems fall back to the pseudo-inverse
+                step = (np.linalg.pinv(lhs) @ jtr[..., None])[..., 0]
+            trial = params[idx] + step
+            trial_cost, trial_resid = cost(idx, trial)
+
+        # Accept improving steps, raise damping elsewhere
+        accept = np.isfinite(trial_cost) & (trial_cost <= fit_cost[idx])
+        done = accept & (
+            (fit_cost[idx] - trial_cost <= tol * fit_cost[idx])
+            | (
+                np.max(np.abs(step) / (np.abs(params[idx]) + tol), axis=1)
+                <= tol
+            )
+        )
+        params[idx[accept]] = trial[accept]
+        fit_cost[idx[accept]] = trial_cost[accept]
+        fit_resid[idx[accept]] = trial_resid[accept]
+        damping[idx] = np.where(accept, damping[idx] / 10, damping[idx] * 10)
+
+        # Stop converged spectra and spectra the damping cannot rescue
+        converged[idx[done]] = True
+        active[idx[done | (damping[idx] > 1e16)]] = False
+
+    # Return fitted params, costs, and convergence mask
+    return (params, fit_cost, converged)
+
+
+# Batched Levenberg-Marquardt fitter
+def batch_fitter(
+    data_freq,
+    data_flux,
+    model="gyro",
+    p0=None,
+    weights=None,
+    cut=None,
+    max_iter=1000,
+    tol=1.49e-8,
+):
+    """
+    Parameters
+    ----------
+    data_freq : array
+        Freq array of shape (freq,) or (spectra, freq).
+    data_flux : array
+        Flux array of shape (spectra, freq), NaN points are skipped.
+    model : string, optional
+        Fit model, "gyro" or "plas". The default is "gyro".
+    p0 : array, optional
+        Initial guess of shape (params,) or (spectra, params). The default
+        is None, the log-space guess with a retry from all ones.
+    weights : array, optional
+        Residual weights broadcast to the flux shape, zero drops a point.
+        The default is None, all ones.
+    cut : float, optional
+        Fit only freq below the cut, as plas_fitter does. The default is
+        None, all freq.
+    max_iter : integer, optional
+        Maximum iterations. The default is 1000, the curve_fit evaluation
+        budget of the gyro model.
+    tol : float, optional
+        Relative cost and step tolerance. The default is 1.49e-8, as in
+        curve_fit.
+
+    Returns
+    -------
+    results : list
+        Tuple of params, cov, chi_sqr, and chi_p_val per spectrum as
+        returned by gyro_fitter, all NaN where the fit did not converge.
+    """
+    # Model functions and stacked float64 arrays
+    func, jac, guess = BATCH_MODELS[model]
+    data_flux = np.atleast_2d(np.asarray(data_flux, dtype=np.float64))
+    data_freq = np.broadcast_to(
+        np.asarray(data_freq, dtype=np.float64), data_flux.shape
+    )
+
+    # Point weights, skipped points get a neutral flux and zero weight
+    weights = np.array(
+        np.broadcast_to(1.0 if weights is None else weights, data_flux.shape),
+        dtype=np.float64,
+    )
+    weights[~np.isfinite(data_flux)] = 0
+    if cut is not None:
+        weights[data_freq >= cut] = 0
+
+    # Initial params, the log-space guess by default
+    params = np.array(
+        np.broadcast_to(
+            guess(data_freq, np.where(weights > 0, data_flux, np.nan))
+            if p0 is None
+            else p0,
+            (len(data_flux), 4 if model == "gyro" else 2),
+        ),
+        dtype=np.float64,
+    )
+    data_flux = np.where(weights > 0, data_flux, 0)
+
+    # Fit all spectra at once
+    args = (max_iter, tol)
+    params, fit_cost, converged = batch_solver(
+        model, data_freq, data_flux, weights, params, *args
+    )
+
+    # Retry spectra the guess did not bring to convergence from all ones
+    retry = np.flatnonzero(~converged) if p0 is None else []
+    if len(retry):
+        (
+            params[retry],
+            fit_cost[retry],
+            converged[retry],
+        ) = batch_solver(
+            model,
+            data_freq[retry],
+            data_flux[retry],
+            weights[retry],
+            np.ones_like(params[retry]),
+            *args,
+        )
+
+    # Results of every spectrum
+    results = []
+    for i, param in enumerate(params):
+        keep = weights[i] > 0
+        chi_dof = int(np.sum(keep)) - len(param)
+        with np.errstate(all="ignore"):
+            fit_jac = weights[i, keep, None] * jac(data_freq[i, keep], *param)
+        if not (converged[i] and chi_dof >= 0 and np.isfinite(fit_jac).all()):
+            # Mark non-converged and overflowed fits as NaN
+            results.append(
+                (
+                    np.full(len(param), np.nan),
+                    np.full((len(param), len(param)), np.nan),
+                    np.nan,
+                    np.nan,
+                )
+            )
+            continue
+
+        # Covariance scaled by the residual variance, as curve_fit does
+        cov = np.linalg.pinv(fit_jac.T @ fit_jac) * (
+            fit_cost[i] / chi_dof if chi_dof > 0 else np.inf
+        )
+
+        # Chi2 of the fitted model
+        fit_model = func(data_freq[i, keep], *param)
+        chi_sqr = np.sum((data_flux[i, keep] - fit_model) ** 2 / fit_model)
+        results.append((param, cov, chi_sqr, 1 - chi2.cdf(chi_sqr, chi_dof)))
+
+    # Return per spectrum results
+    return results
+
+
+# %% Bootstrap uncertainty
+# Fit chain of one batch of resamples
+def resample_batch(args):
+    """
+    Parameters
+    ----------
+    args : tuple
+        Freq array, flux array, cut-off freq, initial A, B, a, b, c, k,
+        and resample weights of shape (resamples, freq).
+
+    Returns
+    -------
+    params : array
+        Fitted A, B, a, b, c, k of shape (resamples, 6), the whole row NaN
+        where either fit did not converge.
+    """
+    # Local variable repo
+    data_freq, data_flux, cut, p0, weights = args
+    data_flux = np.broadcast_to(data_flux, weights.shape)
+
+    # Plas fits of the low freq points of every resample
+    results_plas = batch_fitter(
+        data_freq, data_flux, "plas", p0[4:], weights, cut
+    )
+    params_plas = np.array([res[0] for res in results_plas])
+
+    # Plas denoised resamples, as gyro_pass does for a single spectrum
+    data_gyro = data_flux - np.where(
+        data_freq < cut, plas_model(data_freq, *params_plas.T[..., None]), 0
+    )
+
+    # Gyro fits of the denoised resamples with a converged plas fit
+    ok = np.isfinite(params_plas).all(axis=1)
+    params = np.full((len(weights), 6), np.nan)
+    results_gyro = batch_fitter(
+        data_freq, data_gyro[ok], "gyro", p0[:4], weights[ok]
+    )
+    params[ok] = np.concatenate(
+        [
+            np.array([res[0] for res in results_gyro]).reshape(-1, 4),
+            params_plas[ok],
+        ],
+        axis=1,
+    )
+
+    # Mark the whole row as NaN if either fit failed, as spectrum_fitter does
+    params[~np.isfinite(params).all(axis=1)] = np.nan
+
+    # Return resample params
+    return params
+
+
+# Bootstrap and jackknife uncertainty engine
+def bootstrap_fitter(
+    data_freq,
+    data_flux,
+    cut,
+    method="bootstrap",
+    resamples=10000,
+    level=0.95,
+    seed=0,
+    workers=None,
+    batch_size=1000,
+):
+    """
+    Parameters
+    ----------
+    data_freq : array
+        Combined freq data array.
+    data_flux : array
+        Combined flux data array, NaN channels are skipped.
+    cut : float
+        Cut-off point for different fits.
+    method : string, optional
+        "bootstrap" resamples freq points with replacement, "jackknife"
+        leaves one point out at a time. The default is "bootstrap".
+    resamples : integer, optional
+        Number of bootstrap resamples. The default is 10000.
+    level : float, optional
+        Confidence level of the intervals. The default is 0.95.
+    seed : integer, optional
+        Root seed, results depend on the seed and batch_size but not on
+        workers. The default is 0.
+    workers : integer, optional
+        Number of worker processes. The default is None, one per core.
+    batch_size : integer, optional
+        Resamples per batched fit task. The default is 1000.
+
+    Returns
+    -------
+    params : array
+        Full spectrum fit of A, B, a, b, c, k.
+    conf_int : array
+        Lower and upper bounds of shape (6, 2), percentile intervals for
+        the bootstrap and normal intervals from the jackknife standard
+        error.
+    samples : array
+        Resample params of shape (resamples, 6), whole rows NaN where a fit
+        failed, so all intervals use the same resamples.
+    """
+    # Full spectrum fit as the point estimate and warm start
+    data_freq = np.asarray(data_freq, dtype=np.float64)
+    data_flux = np.asarray(data_flux, dtype=np.float64)
+    results_plas = batch_fitter(data_freq, data_flux, "plas", cut=cut)[0]
+    data_gyro = data_flux - np.where(
+        data_freq < cut, plas_model(data_freq, *results_plas[0]), 0
+    )
+    results_gyro = batch_fitter(data_freq, data_gyro[None])[0]
+    params = np.concatenate([results_gyro[0], results_plas[0]])
+    if not np.all(np.isfinite(params)):
+        raise RuntimeError("Full spectrum fit did not converge")
+
+    # Resample weights, a point drawn n times carries weight sqrt(n)
+    valid = np.isfinite(data_flux)
+    if method == "jackknife":
+        weights = np.repeat(valid[None], np.sum(valid), axis=0).astype(float)
+        weights[np.arange(np.sum(valid)), np.flatnonzero(valid)] = 0
+        weights = [
+            weights[i : i + batch_size]
+            for i in range(0, len(weights), batch_size)
+        ]
+    else:
+        # Independent child seeds per batch keep results reproducible
+        sizes = np.diff(
+            np.append(np.arange(0, resamples, batch_size), resamples)
+        )
+        weights = []
+        for size, child in zip(
+            sizes, np.random.SeedSequence(seed).spawn(len(sizes))
+        ):
+            counts = np.zeros((size, len(data_flux)))
+            counts[:, valid] = np.random.default_rng(child).multinomial(
+                np.sum(valid), np.full(np.sum(valid), 1 / np.sum(valid)), size
+            )
+            weights.append(np.sqrt(counts))
+
+    # Fit resample batches on a process pool
+    args = [(data_freq, data_flux, cut, params, w) for w in weights]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        samples = np.concatenate(
+            [np.empty((0, 6))] + list(pool.map(resample_batch, args))
+        )
+
+    # Confidence intervals of the converged resamples
+    alpha = (1 - level) / 2
+    if method == "jackknife":
+        # Jackknife standard error around the point estimate
+        num = np.sum(np.isfinite(samples[:, 0]))
+        std_err = np.sqrt(
+            (num - 1) / num * np.nansum(
+                (samples - np.nanmean(samples, axis=0)) ** 2, axis=0
+            )
+        )
+        z_val = norm.ppf(1 - alpha)
+        conf_int = np.stack(
+            [params - z_val * std_err, params + z_val * std_err], axis=-1
+        )
+    else:
+        # Percentile intervals of the bootstrap distribution
+        conf_int = np.nanpercentile(
+            samples, [100 * alpha, 100 * (1 - alpha)], axis=0
+        ).T
+
+    # Return point estimate, intervals, and resample params
+    return (params, conf_int, samples)
+
+
+# %% Cut-off freq sweep
+# Fit chain of one cut-off freq
+def cut_job(args):
+    """
+    Parameters
+    ----------
+    args : tuple
+        Freq array, flux array, and cut-off freq.
+
+    Returns
+    -------
+    results : tuple
+        Params and chi2 from spectrum_fitter.
+    """
+    # Return fit chain results
+    return spectrum_fitter(*args)
+
+
+# Parallel cut-off freq sweep
+def cut_sweep(data_freq, data_flux, cuts, workers=None, floor=1e-3):
+    """
+    Parameters
+    ----------
+    data_freq : array
+        Combined freq data array.
+    data_flux : array
+        Combined flux data array, NaN channels are skipped.
+    cuts : array
+        Cut-off freq grid.
+    workers : integer, optional
+        Number of worker processes. The default is None, one per core.
+    floor : float, optional
+        Smallest fitted model value, relative to the absolute flux it fits,
+        of a valid fit. The default is 1e-3.
+
+    Returns
+    -------
+    cuts : array
+        Cut-off freq grid.
+    params : array
+        Denoised gyro A, B, a, b and plas c, k per cut of shape (cuts, 6),
+        NaN where a fit failed, its chi-squared is negative or not finite,
+        or its model falls below floor on a fitted point.
+    chi_sqr : array
+        Gyro and plas chi-squared per cut of shape (cuts, 2), NaN where
+        params are NaN.
+    chi_dof : array
+        Gyro and plas degrees of freedom per cut of shape (cuts, 2).
+    cut_best : float
+        Cut with the smallest combined reduced chi-squared, the summed
+        chi-squared of both fits over their summed degrees of freedom,
+        among cuts with valid fits and positive dof. NaN if no cut
+        qualifies.
+    """
+    # Local variable repo
+    data_freq = np.asarray(data_freq, dtype=np.float64)
+    data_flux = np.asarray(data_flux, dtype=np.float64)
+    cuts = np.asarray(cuts, dtype=np.float64)
+
+    # Group cuts selecting the same low freq points, fit each group once
+    subsets = (data_freq < cuts[:, None]) & np.isfinite(data_flux)
+    _, first, group = np.unique(
+        subsets, axis=0, return_index=True, return_inverse=True
+    )
+    args = [(data_freq, data_flux, cuts[i]) for i in first]
+
+    # Fit the distinct subsets on a process pool
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(cut_job, args))
+
+    # Spread group results back over the cut grid
+    group = np.ravel(group)
+    params, chi_sqr = (
+        np.array([results[i][0] for i in group]).reshape(-1, 6),
+        np.array([results[i][1] for i in group]).reshape(-1, 2),
+    )
+
+    # Diverged fits count as failed - chi2 must be finite and non-negative,
+    # and both models positive and not vanishing on their fitted points,
+    # as chi2 divides by the model
+    valid = np.isfinite(data_flux)
+    with np.errstate(all="ignore"):
+        model_plas = plas_model(data_freq, *params[:, 4:].T[..., None])
+        model_gyro = gyro_model(data_freq, *params[:, :4].T[..., None])
+        data_gyro = data_flux - np.where(subsets, model_plas, 0)
+        broken = ~(
+            np.all(np.isfinite(chi_sqr) & (chi_sqr >= 0), axis=1)
+            & np.all(
+                (model_plas > floor * np.abs(data_flux)) | ~subsets, axis=1
+            )
+            & np.all(
+                (model_gyro > floor * np.abs(data_gyro)) | ~valid, axis=1
+            )
+        )
+    params[broken], chi_sqr[broken] = np.nan, np.nan
+
+    # Degrees of freedom of the gyro fit on all points and the plas fit on
+    # the low freq points of each cut
+    chi_dof = np.stack(
+        [
+            np.full(len(cuts), np.sum(valid) - 4),
+            np.sum(subsets, axis=1) - 2,
+        ],
+        axis=-1,
+    )
+
+    # Optimum by reduced chi2, so cuts fitting fewer points are not favoured
+    with np.errstate(all="ignore"):
+        chi_red = np.where(
+            np.all(chi_dof > 0, axis=1),
+            np.sum(chi_sqr, axis=1) / np.sum(chi_dof, axis=1),
+            np.nan,
+        )
+    cut_best = (
+        cuts[np.nanargmin(chi_red)] if np.any(np.isfinite(chi_red)) else np.nan
+    )
+
+    # Return sweep results
+    return (cuts, params, chi_sqr, chi_dof, cut_best)
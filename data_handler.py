@@ -7,17 +7,35 @@ Created on Wed Mar 15 2023
 """
 # %% Library import
 # Library import
+import os
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from data_reader import csv_loader
+from scipy.ndimage import percentile_filter
+from data_reader import (
+    csv_loader,
+    csv_streamer,
+    csv_column_streamer,
+    dtype_policy,
+    file_resolver,
+    srs_loader,
+    time_index,
+    time_key,
+)
 
 # %% Data loader
 # Combined data loader
-def loader(data_path):
+def loader(data_path, workers=1, policy="default"):
     """
     Parameters
     ----------
     data_path : tuple
-        Tuple of data folder path.
+        Tuple of data folder path, RSTN entries may instead be paths to
+        native fixed-width .srs files.
+    workers : integer, optional
+        Number of threads parsing files concurrently. The default is 1.
+    policy : string or dict, optional
+        Dtype policy of flux and validity arrays, see DTYPE_POLICY.
+        The default is "default".
 
     Returns
     -------
@@ -26,28 +44,198 @@ def loader(data_path):
     """
     # Local path variable repo
     flux, freq, mvd, tim = ("flux.csv", "freq.csv", "mvd.csv", "tim.csv")
+    policy = dtype_policy(policy)
 
-    # Pack data into tuple
-    result = (
-        csv_loader(data_path[0] + flux),
-        csv_loader(data_path[0] + freq),
-        csv_loader(data_path[0] + mvd, dtype=int),
-        csv_loader(data_path[0] + tim, dtype=np.uint64),
-        csv_loader(data_path[1] + flux).transpose(),
-        csv_loader(data_path[1] + freq),
-        csv_loader(data_path[1] + tim, dtype=np.uint64),
-        csv_loader(data_path[2] + flux).transpose(),
-        csv_loader(data_path[2] + freq),
-        csv_loader(data_path[2] + tim, dtype=np.uint64),
+    # File job repo - (file path, dtype, transpose)
+    jobs = (
+        (data_path[0] + flux, policy["flux"], False),
+        (data_path[0] + freq, float, False),
+        (data_path[0] + mvd, policy["mvd"], False),
+        (data_path[0] + tim, np.uint64, False),
     )
 
+    # RSTN jobs from CSV triplets or native fixed-width daily files
+    for path in data_path[1:3]:
+        jobs += (
+            ((path, "srs", False),)
+            if path.lower().endswith(".srs")
+            else (
+                (path + flux, policy["flux"], True),
+                (path + freq, float, False),
+                (path + tim, np.uint64, False),
+            )
+        )
+
+    # Single file job loader
+    def job_loader(job):
+        # Load native RSTN file as flux, freq, and time arrays
+        if job[1] == "srs":
+            data_fi, data_freq, data_tim = srs_loader(job[0])
+            return (data_fi.astype(policy["flux"]), data_freq, data_tim)
+
+        # Load file and transpose RSTN flux arrays
+        data = csv_loader(job[0], dtype=job[1])
+        return (data.transpose() if job[2] else data,)
+
+    # Parse files in order, or on a thread pool with largest files first
+    if workers <= 1:
+        result = sum((job_loader(job) for job in jobs), ())
+    else:
+        order = sorted(
+            range(len(jobs)),
+            key=lambda i: -os.path.getsize(file_resolver(jobs[i][0])),
+        )
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {i: pool.submit(job_loader, jobs[i]) for i in order}
+        result = sum((futures[i].result() for i in range(len(jobs))), ())
+
     # Return the assignment
     return result
 
 
+# %% Lazy dataset loader
+# Lazy instrument dataset
+class Dataset:
+    """
+    Lazy dataset of one instrument folder, each array is parsed on first
+    access and cached afterwards.
+
+    Parameters
+    ----------
+    data_path : string
+        Data folder path of a single instrument, or path to a native RSTN
+        fixed-width .srs file.
+    transpose : bool, optional
+        Flux file is stored transposed as for RSTN. The default is False.
+    policy : string or dict, optional
+        Dtype policy of flux and validity arrays, see DTYPE_POLICY.
+        The default is "default".
+    """
+
+    # File repo - name: (file name, dtype)
+    files = {
+        "flux": ("flux.csv", float),
+        "freq": ("freq.csv", float),
+        "mvd": ("mvd.csv", int),
+        "tim": ("tim.csv", np.uint64),
+        "fv": ("fv.csv", float),
+        "day": ("day.csv", int),
+    }
+
+    def __init__(self, data_path, transpose=False, policy="default"):
+        # Path, layout, and dtype policy repo
+        self.data_path, self.transpose = data_path, transpose
+        self.policy = dtype_policy(policy)
+        self.cache = {}
+
+    def __getattr__(self, name):
+        # Only dataset files are resolved lazily
+        if name not in type(self).files:
+            raise AttributeError(name)
+
+        # Parse native RSTN fixed-width file on first access
+        if name not in self.cache and self.data_path.lower().endswith(".srs"):
+            if name not in ("flux", "freq", "tim"):
+                raise FileNotFoundError(f"{self.data_path} has no {name}")
+            data_fi, data_freq, data_tim = srs_loader(self.data_path)
+            self.cache.update(
+                flux=data_fi.astype(self.policy["flux"]),
+                freq=data_freq,
+                tim=data_tim,
+            )
+
+        # Parse on first access
+        if name not in self.cache:
+            file, dtype = type(self).files[name]
+            dtype = self.policy.get(name, dtype)
+            data = csv_loader(self.data_path + file, dtype=dtype)
+            if name == "flux" and self.transpose:
+                data = data.transpose()
+            self.cache[name] = data
+
+        # Return cached array
+        return self.cache[name]
+
+    def loaded(self):
+        """
+        Returns
+        -------
+        names : tuple
+            Names of the arrays parsed so far.
+        """
+        # Return parsed array names
+        return tuple(self.cache)
+
+
+# Lazy combined data loader
+def lazy_loader(data_path, policy="default"):
+    """
+    Parameters
+    ----------
+    data_path : tuple
+        Tuple of data folder path.
+    policy : string or dict, optional
+        Dtype policy of flux and validity arrays, see DTYPE_POLICY.
+        The default is "default".
+
+    Returns
+    -------
+    result : tuple
+        Tuple of lazy NoRP, apl, and phf datasets.
+    """
+    # Return lazy datasets, RSTN flux files are transposed
+    return (
+        Dataset(data_path[0], policy=policy),
+        Dataset(data_path[1], transpose=True, policy=policy),
+        Dataset(data_path[2], transpose=True, policy=policy),
+    )
+
+
 # %% Data validator
+# Chunked validity mask generator
+def validity_mask(data_norp_mvd, chunk_size=65536, channels=None):
+    """
+    Parameters
+    ----------
+    data_norp_mvd : array
+        Validity array of NORP data.
+    chunk_size : integer, optional
+        Rows reduced per chunk. The default is 65536.
+    channels : integer, optional
+        Number of freq channels of bit-packed validity rows.
+        The default is None, validity rows are not packed.
+
+    Returns
+    -------
+    data_norp_mask : array
+        Boolean mask of rows valid at every freq.
+    """
+    # Packed rows are valid when every channel bit is set
+    expected = (
+        None
+        if channels is None
+        else np.packbits(np.ones(channels, dtype=bool))
+    )
+
+    # Reduce bounded row chunks into a preallocated mask
+    data_norp_mask = np.empty(data_norp_mvd.shape[0], dtype=bool)
+    for i in range(0, data_norp_mvd.shape[0], chunk_size):
+        np.all(
+            data_norp_mvd[i : i + chunk_size]
+            if expected is None
+            else data_norp_mvd[i : i + chunk_size] == expected,
+            axis=1,
+            out=data_norp_mask[i : i + chunk_size],
+        )
+
+    # Return valid row mask
+    return data_norp_mask
+
+
 # NORP data filter based on mvd file
-def validator(data_norp_mvd, data_norp_tim, data_norp_fi):
+def validator(
+    data_norp_mvd, data_norp_tim, data_norp_fi, mode="copy", chunk_size=65536
+):
     """
     Parameters
     ----------
@@ -57,6 +245,15 @@ def validator(data_norp_mvd, data_norp_tim, data_norp_fi):
         Time array of NORP data.
     data_norp_fi : array
         Flux array of NORP data.
+    mode : string, optional
+        Filter mode. The default is "copy".
+        "copy" - return filtered copies.
+        "index" - return the valid row index array only.
+        "view" - return masked array views sharing the input buffers.
+        "inplace" - compact valid rows to the front of the input buffers
+        and return views of the valid prefix.
+    chunk_size : integer, optional
+        Rows processed per chunk. The default is 65536.
 
     Returns
     -------
@@ -65,8 +262,40 @@ def validator(data_norp_mvd, data_norp_tim, data_norp_fi):
     data_norp_fi_valid : array
         Valid flux array of NORP data.
     """
-    # Generate valid data mask based on boolean readout over single rows
-    data_norp_mask = np.all(data_norp_mvd.astype(bool), axis=1)
+    # Generate valid data mask based on boolean readout over single rows,
+    # validity narrower than the flux array is bit-packed
+    data_norp_mask = validity_mask(
+        data_norp_mvd,
+        chunk_size,
+        None
+        if data_norp_mvd.shape[1] == data_norp_fi.shape[1]
+        else data_norp_fi.shape[1],
+    )
+
+    # Return valid row index array
+    if mode == "index":
+        return np.flatnonzero(data_norp_mask)
+
+    # Return masked views, invalid rows are masked out
+    if mode == "view":
+        return (
+            np.ma.masked_array(data_norp_tim, mask=~data_norp_mask),
+            np.ma.masked_array(
+                data_norp_fi,
+                mask=np.broadcast_to(
+                    ~data_norp_mask[:, None], data_norp_fi.shape
+                ),
+            ),
+        )
+
+    # Compact valid rows in place, moving chunk by chunk from the front
+    if mode == "inplace":
+        idx = np.flatnonzero(data_norp_mask)
+        for i in range(0, len(idx), chunk_size):
+            idx_chunk = idx[i : i + chunk_size]
+            data_norp_tim[i : i + len(idx_chunk)] = data_norp_tim[idx_chunk]
+            data_norp_fi[i : i + len(idx_chunk)] = data_norp_fi[idx_chunk]
+        return (data_norp_tim[: len(idx)], data_norp_fi[: len(idx)])
 
     # Filter the time and flux data through mask
     data_norp_tim_valid, data_norp_fi_valid = (
@@ -79,28 +308,326 @@ def validator(data_norp_mvd, data_norp_tim, data_norp_fi):
 
 
 # %% Quiet sun flux calculator
+# Rolling mean baseline
+def rolling_mean(array, window):
+    """
+    Parameters
+    ----------
+    array : array
+        Flux array of shape (time, freq).
+    window : integer
+        Centered window length in samples.
+
+    Returns
+    -------
+    array_mean : array
+        Rolling mean, windows shrink at the array edges.
+    """
+    # Cumulative sum about the global mean to limit round-off
+    offset = np.mean(array, axis=0)
+    array_sum = np.zeros((array.shape[0] + 1,) + array.shape[1:])
+    np.cumsum(array - offset, axis=0, out=array_sum[1:])
+
+    # Window edges clipped to the array
+    idx = np.arange(array.shape[0]) - window // 2
+    idx_lo, idx_hi = (
+        np.clip(idx, 0, array.shape[0]),
+        np.clip(idx + window, 0, array.shape[0]),
+    )
+
+    # Return window sums over window lengths
+    return offset + (array_sum[idx_hi] - array_sum[idx_lo]) / (
+        idx_hi - idx_lo
+    ).reshape((-1,) + (1,) * (array.ndim - 1))
+
+
+# Rolling quantile baseline
+def rolling_quantile(array, window, percentile):
+    """
+    Parameters
+    ----------
+    array : array
+        Flux array of shape (time, freq).
+    window : integer
+        Centered window length in samples.
+    percentile : float
+        Percentile of the window, 50 for the median.
+
+    Returns
+    -------
+    array_quantile : array
+        Rolling percentile, edges repeat the nearest sample.
+    """
+    # Run the sliding-window rank filter of each freq channel, 1-D input
+    # takes the O(n log window) running rank path of scipy.ndimage
+    array_2d = np.asarray(array, dtype=float).reshape(array.shape[0], -1)
+    array_quantile = np.stack(
+        [
+            percentile_filter(
+                array_2d[:, i], percentile, size=window, mode="nearest"
+            )
+            for i in range(array_2d.shape[1])
+        ],
+        axis=1,
+    )
+
+    # Return rolling quantile in the input shape
+    return array_quantile.reshape(array.shape)
+
+
+# Baseline generator
+def baseline(array, method="mean", window=None, percentile=5):
+    """
+    Parameters
+    ----------
+    array : array
+        Flux array of shape (time, freq).
+    method : string, optional
+        Baseline method. The default is "mean".
+        "mean", "median", "percentile" - global baselines.
+        "rolling_mean", "rolling_median" - baselines over a moving window.
+    window : integer, optional
+        Rolling window length in samples. The default is None.
+    percentile : float, optional
+        Percentile of the "percentile" baseline. The default is 5.
+
+    Returns
+    -------
+    array_base : array
+        Baseline flux, broadcastable against the flux array.
+    """
+    # Baseline method repo
+    methods = {
+        "mean": lambda: np.mean(array, axis=0, dtype=np.float64),
+        "median": lambda: np.median(array, axis=0),
+        "percentile": lambda: np.percentile(array, percentile, axis=0),
+        "rolling_mean": lambda: rolling_mean(array, window),
+        "rolling_median": lambda: rolling_quantile(array, window, 50),
+    }
+    if method not in methods:
+        raise ValueError(f"Unknown quiet sun baseline: {method}")
+    if method.startswith("rolling") and not window:
+        raise ValueError(f"Baseline {method} needs a window")
+
+    # Return baseline flux
+    return methods[method]()
+
+
 # Quiet sun calculator
-def quiet_sun(data_array_tuple):
+def quiet_sun(
+    data_array_tuple,
+    method="mean",
+    span=None,
+    time_tuple=None,
+    percentile=5,
+):
     """
     Parameters
     ----------
     data_array_tuple : tuple
         Flux array tuple.
+    method : string, optional
+        Baseline method, see baseline. The default is "mean".
+    span : float, optional
+        Rolling window span in seconds. The default is None.
+    time_tuple : tuple, optional
+        Time arrays or time indices matching the flux arrays, used to turn
+        span into samples at each instrument cadence, required with span.
+        The default is None.
+    percentile : float, optional
+        Percentile of the "percentile" baseline. The default is 5.
 
     Returns
     -------
     data_array_repo : tuple
         Filtered quiet sun array data tuple.
     """
+    # Rolling window samples from the median cadence of each instrument
+    windows = (None,) * len(data_array_tuple)
+    if span is not None:
+        if time_tuple is None:
+            raise ValueError("Quiet sun span needs a time_tuple")
+        cadences = (
+            np.median(np.diff(time_index(tim).key)) for tim in time_tuple
+        )
+        windows = tuple(
+            max(1, int(round(span * 1000 / cadence))) for cadence in cadences
+        )
+
     # Loop through the arrays to generate quiet sun flux array tuple
     data_array_repo = tuple(
-        array - np.mean(array, axis=0) for array in data_array_tuple
+        array - np.asarray(
+            baseline(array, method, window, percentile), dtype=array.dtype
+        )
+        for array, window in zip(data_array_tuple, windows)
     )
 
     # Return quiet sun flux array tuple
     return data_array_repo
 
 
+# %% Streaming data handler
+# Aligned block streamer
+def stream_loader(
+    data_path, chunk_size=100000, transpose=False, policy="default"
+):
+    """
+    Parameters
+    ----------
+    data_path : string
+        Data folder path of a single instrument.
+    chunk_size : integer, optional
+        Maximum number of time rows per block. The default is 100000.
+    transpose : bool, optional
+        Flux file is stored transposed as for RSTN. The default is False.
+    policy : string or dict, optional
+        Dtype policy of flux and validity arrays, see DTYPE_POLICY.
+        The default is "default".
+
+    Yields
+    ------
+    block : tuple
+        Aligned time, flux, and validity arrays of one block.
+    """
+    # Local path variable repo
+    flux, mvd, tim = ("flux.csv", "mvd.csv", "tim.csv")
+    policy = dtype_policy(policy)
+    packed = isinstance(policy["mvd"], str) and policy["mvd"] == "packed"
+
+    # Flux streamer, RSTN flux is stored one row per freq
+    streamer = csv_column_streamer if transpose else csv_streamer
+    flux_stream = streamer(data_path + flux, chunk_size, policy["flux"])
+
+    # Validity streamer, all valid when no mvd file is recorded
+    tim_stream = csv_streamer(data_path + tim, chunk_size, dtype=np.uint64)
+    mvd_stream = (
+        csv_streamer(
+            data_path + mvd,
+            chunk_size,
+            dtype=np.uint8 if packed else policy["mvd"],
+        )
+        if os.path.exists(file_resolver(data_path + mvd))
+        else None
+    )
+
+    # Yield aligned blocks
+    for data_tim in tim_stream:
+        data_fi = next(flux_stream)
+        data_mvd = (
+            np.ones(data_fi.shape, dtype=bool)
+            if mvd_stream is None
+            else next(mvd_stream)
+        )
+        if packed:
+            data_mvd = np.packbits(data_mvd, axis=1)
+        yield (data_tim, data_fi, data_mvd)
+
+
+# Streaming validator
+def stream_validator(data_stream):
+    """
+    Parameters
+    ----------
+    data_stream : iterable
+        Aligned (time, flux, validity) blocks.
+
+    Yields
+    ------
+    block : tuple
+        Valid time and flux arrays of one block.
+    """
+    # Apply the validator block by block
+    for data_tim, data_fi, data_mvd in data_stream:
+        yield validator(data_mvd, data_tim, data_fi)
+
+
+# Streaming quiet sun calculator
+def stream_quiet_sun(data_stream_factory):
+    """
+    Parameters
+    ----------
+    data_stream_factory : callable
+        Returns a fresh iterable of (time, flux) blocks on each call.
+
+    Yields
+    ------
+    block : tuple
+        Time and quiet sun subtracted flux arrays of one block.
+    """
+    # First pass - accumulate quiet sun flux sums
+    data_sum, data_count = 0.0, 0
+    for _, data_fi in data_stream_factory():
+        data_sum = data_sum + np.sum(data_fi, axis=0, dtype=np.float64)
+        data_count += data_fi.shape[0]
+
+    # Quiet sun mean flux
+    data_mean = data_sum / max(data_count, 1)
+
+    # Second pass - yield quiet sun subtracted blocks
+    for data_tim, data_fi in data_stream_factory():
+        yield (data_tim, data_fi - data_mean)
+
+
+# %% Freq grouper
+# Grouped unique freq reduction
+def freq_grouper(data_freq, data_flux):
+    """
+    Parameters
+    ----------
+    data_freq : array
+        Combined freq array, duplicates allowed.
+    data_flux : array
+        Combined flux array of shape (freq,) or a batch of spectra of shape
+        (spectra, freq).
+
+    Returns
+    -------
+    data_freq_unique : array
+        Sorted unique freq array.
+    data_flux_mean : array
+        Mean flux per unique freq.
+    data_count : array
+        Number of combined channels per unique freq.
+    data_flux_var : array
+        Flux variance per unique freq.
+    """
+    # Unique freq groups and group labels of each channel
+    data_freq_unique, inverse, data_count = np.unique(
+        data_freq, return_inverse=True, return_counts=True
+    )
+
+    # Offset group labels per spectrum for a single flat bincount
+    data_flux_2d = np.atleast_2d(data_flux)
+    rows, groups = data_flux_2d.shape[0], len(data_freq_unique)
+    labels = (inverse + groups * np.arange(rows)[:, None]).ravel()
+
+    # Grouped mean and variance
+    data_flux_mean = (
+        np.bincount(labels, data_flux_2d.ravel(), rows * groups).reshape(
+            rows, groups
+        )
+        / data_count
+    )
+    data_flux_var = (
+        np.bincount(
+            labels,
+            ((data_flux_2d - data_flux_mean[:, inverse]) ** 2).ravel(),
+            rows * groups,
+        ).reshape(rows, groups)
+        / data_count
+    )
+
+    # Return grouped results in the input dtype and layout
+    dtype = np.result_type(data_flux, np.float32)
+    data_flux_mean, data_flux_var = (
+        data_flux_mean.astype(dtype, copy=False),
+        data_flux_var.astype(dtype, copy=False),
+    )
+    if np.ndim(data_flux) == 1:
+        data_flux_mean, data_flux_var = data_flux_mean[0], data_flux_var[0]
+    return (data_freq_unique, data_flux_mean, data_count, data_flux_var)
+
+
 # %% Peak time array collector
 # Peak time array collector
 def collector(arg_time, arg_freq, arg_flux):
@@ -150,9 +677,9 @@ def collector(arg_time, arg_freq, arg_flux):
 
         # Index locator
         idx_norp, idx_apl, idx_phf = (
-            np.where(data_norp_tim_valid == data_norp_peak_time)[0][0],
-            np.where(data_apl_tim == data_norp_peak_time)[0][0],
-            np.where(data_phf_tim == data_norp_peak_time)[0][0],
+            time_index(data_norp_tim_valid).locate(data_norp_peak_time),
+            time_index(data_apl_tim).locate(data_norp_peak_time),
+            time_index(data_phf_tim).locate(data_norp_peak_time),
         )
 
         # Return index repo
@@ -236,26 +763,279 @@ def collector(arg_time, arg_freq, arg_flux):
         arg_flux
     )
 
-    # Array sorter
-    # Get numpy index sort array
-    idx_sort = np.argsort(data_freq_combined)
-    # Sort array with index
-    data_freq_sorted, data_flux_sorted = (
-        data_freq_combined[idx_sort],
-        data_flux_combined[idx_sort],
+    # Average duplicate freq values with a grouped reduction
+    data_freq_final, data_flux_final = freq_grouper(
+        data_freq_combined, data_flux_combined
+    )[:2]
+
+    # Return combined peak time flux array
+    return (data_freq_final, data_flux_final)
+
+
+# %% Batched spectra collector
+# Combined spectra collector at many timestamps
+def spectra_collector(arg_time, arg_freq, arg_flux, data_times="rstn"):
+    """
+    Parameters
+    ----------
+    arg_time : tuple
+        Tuple of NoRP, apl, and phf time arrays or time indices.
+    arg_freq : tuple
+        Tuple of freq data arrays.
+    arg_flux : tuple
+        Tuple of flux data arrays.
+    data_times : array or string, optional
+        Timestamps of the spectra, or "rstn" for every second recorded by
+        both RSTN instruments. The default is "rstn".
+
+    Returns
+    -------
+    data_times : array
+        Spectrum timestamps in datetime64[s].
+    data_freq_final : array
+        Sorted unique freq array.
+    data_flux_final : array
+        Combined spectra of shape (times, freq), NaN where an instrument
+        has no sample in that second.
+    """
+    # Shared time indices
+    indices = tuple(time_index(tim) for tim in arg_time)
+
+    # Spectrum timestamps matched to the second
+    if isinstance(data_times, str) and data_times == "rstn":
+        data_times = np.intersect1d(
+            indices[1].tim.astype("datetime64[s]"),
+            indices[2].tim.astype("datetime64[s]"),
+        )
+    data_times = np.asarray(data_times, dtype="datetime64[s]")
+
+    # Gather rows of every instrument at once, missing rows as NaN
+    data_flux = []
+    for index, flux in zip(indices, arg_flux):
+        idx = index.within(data_times)
+        rows = np.asarray(flux)[np.maximum(idx, 0)].astype(
+            np.result_type(flux, np.float32)
+        )
+        rows[idx < 0] = np.nan
+        data_flux.append(rows)
+
+    # Merge duplicate freq values of all spectra in one grouped reduction
+    data_freq_final, data_flux_final = freq_grouper(
+        np.concatenate(arg_freq), np.concatenate(data_flux, axis=1)
+    )[:2]
+
+    # Return timestamps and combined spectra matrix
+    return (data_times, data_freq_final, data_flux_final)
+
+
+# %% Time grid resampler
+# Common time grid generator
+def time_grid(data_start, data_stop, bin_width):
+    """
+    Parameters
+    ----------
+    data_start : string or datetime64
+        Start of the grid, inclusive.
+    data_stop : string or datetime64
+        End of the grid, the last bin ends at or after this time.
+    bin_width : float
+        Bin width in seconds.
+
+    Returns
+    -------
+    data_edges : array
+        Bin edges in datetime64[ms].
+    """
+    # Local variable repo
+    width = int(round(bin_width * 1000))
+    start, stop = time_key([data_start, data_stop])
+
+    # Return evenly spaced bin edges covering the range
+    bins = -(-(stop - start) // width)
+    return (start + width * np.arange(bins + 1)).astype("datetime64[ms]")
+
+
+# Cadence aware resampler
+def resampler(data_tim, data_flux, data_edges):
+    """
+    Parameters
+    ----------
+    data_tim : array or TimeIndex
+        Time array or time index of the instrument.
+    data_flux : array
+        Flux array of shape (time, freq).
+    data_edges : array
+        Bin edges in datetime64, see time_grid.
+
+    Returns
+    -------
+    data_bins : array
+        Bin start times in datetime64[ms].
+    data_flux_mean : array
+        Mean flux per bin in the input float dtype, NaN for empty bins.
+    data_count : array
+        Number of samples per bin.
+    """
+    # Sample positions of the bin edges in the shared time index
+    index = time_index(data_tim)
+    pos = np.searchsorted(index.key, time_key(data_edges))
+    data_count = np.diff(pos)
+
+    # Covered samples only, in time order and promoted after slicing
+    data_flux = np.asarray(data_flux)
+    rows = (
+        slice(pos[0], pos[-1])
+        if index.order is None
+        else index.order[pos[0] : pos[-1]]
+    )
+    data_dtype = np.result_type(data_flux, np.float32)
+    data_flux = data_flux[rows].astype(np.float64)
+
+    # Window sums from a cumulative sum over the covered samples
+    data_sum = np.zeros((pos[-1] - pos[0] + 1,) + data_flux.shape[1:])
+    np.cumsum(data_flux, axis=0, out=data_sum[1:])
+    data_flux_sum = data_sum[pos[1:] - pos[0]] - data_sum[pos[:-1] - pos[0]]
+
+    # Bin means in the input float dtype, empty bins left as NaN
+    with np.errstate(invalid="ignore", divide="ignore"):
+        data_flux_mean = (
+            data_flux_sum
+            / data_count.reshape((-1,) + (1,) * (data_flux.ndim - 1))
+        ).astype(data_dtype)
+
+    # Return bin starts, means, and counts
+    return (
+        np.asarray(data_edges, dtype="datetime64[ms]")[:-1],
+        data_flux_mean,
+        data_count,
     )
 
-    # Array uniqe value filter
-    # Get the unique freq values array
-    data_freq_final = np.unique(data_freq_sorted)
 
-    # Calculate the mean y values for each unique x value
-    data_flux_final = np.array(
-        [
-            np.mean(data_flux_sorted[data_freq_sorted == xval])
-            for xval in data_freq_final
+# %% Flare peak detector
+# Streaming flare peak detector
+def peak_detector(
+    data_blocks, span=10, threshold=5, separation=60, warmup=120
+):
+    """
+    Parameters
+    ----------
+    data_blocks : iterable
+        Time and quiet sun subtracted flux blocks in time order, such as
+        stream_quiet_sun output or [(data_tim, data_fi_peak)].
+    span : float, optional
+        Trailing smoothing window in seconds. The default is 10.
+    threshold : float, optional
+        Detection threshold in robust standard deviations of the smoothed
+        flux above its median over the warm-up. The default is 5.
+    separation : float, optional
+        Minimum separation of two peaks in seconds. The default is 60.
+    warmup : float, optional
+        Flare free seconds at the start of the stream that set the
+        baseline, the whole stream if shorter. The default is 120.
+
+    Returns
+    -------
+    data_peak_time : array
+        Peak times in datetime64[s], usable as collector peak times.
+    data_peak_amp : array
+        Channel summed flux at each peak.
+    """
+    # Local variable repo
+    candidates, run, base = [], None, None
+    carry_key, carry_val, warm = np.empty(0, np.int64), np.empty(0), []
+
+    # Label runs above the baseline threshold, merged across block edges
+    def scan(data_key, data_total, data_smooth):
+        nonlocal run
+        above = data_smooth > base
+        sel = np.flatnonzero(above)
+        if not len(sel):
+            if run is not None:
+                candidates.append(run)
+                run = None
+            return
+
+        # Raw maximum of each run, the earliest one on ties
+        labels = np.cumsum(np.diff(np.concatenate([[-2], sel])) > 1)
+        order = np.lexsort((-data_total[sel], labels))
+        first = order[np.flatnonzero(np.diff(labels[order], prepend=-1))]
+        runs = [
+            (int(data_key[sel[i]]), float(data_total[sel[i]])) for i in first
         ]
-    )
 
-    # Return combined peak time flux array
-    return (data_freq_final, data_flux_final)
+        # Merge runs continuing across block edges
+        if run is not None:
+            if above[0]:
+                runs[0] = max(run, runs[0], key=lambda peak: peak[1])
+            else:
+                candidates.append(run)
+        run = runs.pop() if above[-1] else None
+        candidates.extend(runs)
+
+    # Robust threshold from the median absolute deviation over the warm-up
+    def baseline_level(data_smooth):
+        data_med = np.median(data_smooth)
+        data_mad = 1.4826 * np.median(np.abs(data_smooth - data_med))
+        return data_med + threshold * max(data_mad, 1e-12)
+
+    # Scan blocks with a causal moving average over a fixed time window
+    for data_tim, data_flux in data_blocks:
+        data_total = np.nansum(
+            np.asarray(data_flux, dtype=float).reshape(len(data_tim), -1),
+            axis=1,
+        )
+        if not len(data_total):
+            continue
+        data_key = time_key(data_tim)
+
+        # Trailing means over (t - span, t] of the carried and new samples,
+        # independent of where the blocks split
+        ext_key = np.concatenate([carry_key, data_key])
+        ext_val = np.concatenate([carry_val, data_total])
+        ext_sum = np.concatenate([[0.0], np.cumsum(ext_val)])
+        idx = np.arange(len(carry_key), len(ext_key)) + 1
+        idx_lo = np.searchsorted(ext_key, data_key - span * 1000, "right")
+        data_smooth = (ext_sum[idx] - ext_sum[idx_lo]) / (idx - idx_lo)
+        keep = ext_key > data_key[-1] - span * 1000
+        carry_key, carry_val = ext_key[keep], ext_val[keep]
+
+        # Hold samples until the warm-up has passed, then fix the baseline
+        if base is None:
+            warm.append((data_key, data_total, data_smooth))
+            if data_key[-1] - warm[0][0][0] < warmup * 1000:
+                continue
+            data_key, data_total, data_smooth = (
+                np.concatenate(arr) for arr in zip(*warm)
+            )
+            base = baseline_level(
+                data_smooth[data_key - data_key[0] < warmup * 1000]
+            )
+            warm = []
+        scan(data_key, data_total, data_smooth)
+
+    # Short streams use every sample as the warm-up
+    if base is None and warm:
+        data_key, data_total, data_smooth = (
+            np.concatenate(arr) for arr in zip(*warm)
+        )
+        base = baseline_level(data_smooth)
+        scan(data_key, data_total, data_smooth)
+    if run is not None:
+        candidates.append(run)
+
+    # Keep the largest peak within each separation window
+    peaks = []
+    for peak in candidates:
+        if peaks and peak[0] - peaks[-1][0] < separation * 1000:
+            peaks[-1] = max(peaks[-1], peak, key=lambda item: item[1])
+        else:
+            peaks.append(peak)
+
+    # Return peak times and amplitudes
+    data_peaks = np.array(peaks, dtype=float).reshape(-1, 2)
+    return (
+        data_peaks[:, 0].astype(np.int64).astype("datetime64[ms]").astype(
+            "datetime64[s]"
+        ),
+        data_peaks[:, 1],
+    )
@@ -0,0 +1,346 @@
+"""
+This is the live ingest script of the radio data analysis project.
+
+Created on Sun Oct 18 2026
+
+@author: Yang-Taotao
+"""
+# %% Library import
+# Library import
+import os
+import time
+import queue
+import socket
+import threading
+import numpy as np
+
+# Custom module import
+from data_reader import TIME_ORIGIN, time_decoder, time_key
+
+# %% Live record format
+# One record per line - name,ms,days,flux...[,mvd...]
+# name is "norp", "apl", or "phf", mvd fields follow for NoRP only
+
+
+# Record line formatter
+def record_formatter(name, data_tim, data_fi, data_mvd=None):
+    """
+    Parameters
+    ----------
+    name : string
+        Instrument name.
+    data_tim : array
+        Time array in datetime64.
+    data_fi : array
+        Flux array.
+    data_mvd : array, optional
+        Validity array. The default is None.
+
+    Returns
+    -------
+    lines : list
+        Live record lines.
+    """
+    # Split times back into ms and days since the time origin
+    data_ms = time_key(data_tim) - time_key(TIME_ORIGIN)
+    data_days, data_ms = np.divmod(data_ms, 86400000)
+
+    # Stack record fields
+    data_rec = [data_ms[:, None], data_days[:, None], data_fi]
+    if data_mvd is not None:
+        data_rec.append(data_mvd)
+    data_rec = np.hstack([np.asarray(rec, dtype=object) for rec in data_rec])
+
+    # Return record lines
+    return [name + "," + ",".join(map(str, rec)) + "\n" for rec in data_rec]
+
+
+# Record batch parser
+def record_parser(lines, channels):
+    """
+    Parameters
+    ----------
+    lines : list
+        Live record lines.
+    channels : dict
+        Number of freq channels per instrument name.
+
+    Returns
+    -------
+    blocks : list
+        Tuples of instrument name and its time, flux, and validity arrays,
+        one per instrument and record layout in order of first appearance,
+        validity is None for records without validity fields.
+    dropped : integer
+        Number of malformed lines skipped, blank lines are not counted.
+    """
+    # Group lines by instrument name and record layout, skip blank lines
+    # and count lines of an unknown instrument or field count
+    groups, dropped = {}, 0
+    for line in lines:
+        name, _, rest = line.partition(",")
+        if not rest.strip():
+            continue
+        fields = rest.count(",") + 1
+        if name in channels and fields in (
+            2 + channels[name],
+            2 + 2 * channels[name],
+        ):
+            groups.setdefault((name, fields), []).append(rest)
+        else:
+            dropped += 1
+
+    # Parse each group with one vectorized call
+    blocks = []
+    for (name, fields), rest in groups.items():
+        try:
+            data = np.loadtxt(rest, delimiter=",", ndmin=2)
+        except ValueError:
+            # Parse line by line, dropping lines with bad values
+            data = []
+            for line in rest:
+                try:
+                    data.append(np.array(line.split(","), dtype=float))
+                except ValueError:
+                    dropped += 1
+            if not data:
+                continue
+            data = np.array(data)
+
+        # Drop records with unusable time fields
+        valid = np.all(np.isfinite(data[:, :2]) & (data[:, :2] >= 0), axis=1)
+        data, dropped = data[valid], dropped + int(np.sum(~valid))
+        if not len(data):
+            continue
+
+        # Split time, flux, and validity fields
+        num = channels[name]
+        blocks.append(
+            (
+                name,
+                (
+                    time_decoder(data[:, :2].astype(np.uint64)),
+                    data[:, 2 : 2 + num],
+                    data[:, 2 + num :].astype(np.uint8)
+                    if fields > 2 + num
+                    else None,
+                ),
+            )
+        )
+
+    # Return parsed blocks and the malformed line count
+    return (blocks, dropped)
+
+
+# %% Live sources
+# Growing file tailer
+def file_tailer(file_path, poll=0.5, idle=None, stop=None):
+    """
+    Parameters
+    ----------
+    file_path : string
+        Path to the growing record file.
+    poll : float, optional
+        Seconds between checks for new data. The default is 0.5.
+    idle : float, optional
+        Stop after this many seconds without new data. The default is None,
+        tail until stopped.
+    stop : threading.Event, optional
+        Stop signal. The default is None.
+
+    Yields
+    ------
+    line : string
+        Complete record line.
+    """
+    # Local variable repo
+    rest, last = "", time.monotonic()
+
+    # Read appended complete lines, keep a trailing partial line
+    with open(file_path, "r", encoding="ascii", errors="replace") as file:
+        while stop is None or not stop.is_set():
+            data = file.read(65536)
+            if not data:
+                if idle is not None and time.monotonic() - last > idle:
+                    break
+                time.sleep(poll)
+                continue
+            last = time.monotonic()
+            *lines, rest = (rest + data).split("\n")
+            for line in lines:
+                yield line + "\n"
+
+
+# Socket record reader
+def socket_reader(address, poll=0.5, stop=None):
+    """
+    Parameters
+    ----------
+    address : tuple or string
+        (host, port) of a local TCP feed, or a Unix socket path.
+    poll : float, optional
+        Seconds between stop checks while the feed is quiet. The default
+        is 0.5.
+    stop : threading.Event, optional
+        Stop signal. The default is None.
+
+    Yields
+    ------
+    line : string
+        Complete record line.
+    """
+    # Connect to the TCP or Unix socket feed
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.connect(address)
+        sock.settimeout(poll)
+        rest = b""
+
+        # Read until the feed closes, keep a trailing partial line
+        while stop is None or not stop.is_set():
+            try:
+                data = sock.recv(65536)
+            except socket.timeout:
+                continue
+            if not data:
+                break
+            *lines, rest = (rest + data).split(b"\n")
+            for line in lines:
+                yield line.decode("ascii", errors="replace") + "\n"
+
+
+# Local stand-in socket feeder
+def socket_feeder(address, lines, rate=None):
+    """
+    Parameters
+    ----------
+    address : tuple or string
+        (host, port) to serve on, or a Unix socket path.
+    lines : iterable
+        Record lines to send.
+    rate : float, optional
+        Lines per second. The default is None, as fast as possible.
+
+    Returns
+    -------
+    thread : threading.Thread
+        Started feeder thread serving a single connection.
+    """
+    # Bind before returning so readers can connect right away
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    server = socket.socket(family, socket.SOCK_STREAM)
+    if family == socket.AF_UNIX and os.path.exists(address):
+        os.remove(address)
+    server.bind(address)
+    server.listen(1)
+
+    # Send lines to one client, blocking sends follow reader backpressure
+    def feed():
+        with server:
+            conn, _ = server.accept()
+            with conn:
+                try:
+                    for line in lines:
+                        conn.sendall(line.encode("ascii"))
+                        if rate:
+                            time.sleep(1 / rate)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The reader stopped early
+                    return
+
+    # Return started feeder thread
+    thread = threading.Thread(target=feed, daemon=True)
+    thread.start()
+    return thread
+
+
+# %% Live ingest
+# Live ingest runner
+def live_ingest(
+    source, engine, batch_size=1000, max_batches=16, stop=None, poll=0.5
+):
+    """
+    Parameters
+    ----------
+    source : iterable
+        Record line source, such as file_tailer or socket_reader.
+    engine : OnlineEngine
+        Engine running validator, quiet sun, and collector updates.
+    batch_size : integer, optional
+        Maximum lines per parsed batch. The default is 1000.
+    max_batches : integer, optional
+        Bounded queue length in batches, a full queue blocks the source
+        reader. The default is 16.
+    stop : threading.Event, optional
+        Stop signal, pass the same event to the source so it closes
+        promptly. The default is None, a private event.
+    poll : float, optional
+        Seconds between stop checks of a reader blocked on a full queue.
+        The default is 0.5.
+
+    Yields
+    ------
+    status : tuple
+        Number of records parsed, number of malformed lines dropped, and
+        refit flag of each batch.
+    """
+    # Bounded batch queue between the reader thread and the consumer
+    batches = queue.Queue(maxsize=max_batches)
+    channels = {name: len(freq) for name, freq in engine.freq.items()}
+    stop = threading.Event() if stop is None else stop
+
+    # Blocking put that gives up once the consumer stops
+    def put(batch):
+        while not stop.is_set():
+            try:
+                batches.put(batch, timeout=poll)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    # Reader thread, blocking puts push backpressure onto the source
+    def reader():
+        batch = []
+        try:
+            for line in source:
+                batch.append(line)
+                if len(batch) >= batch_size:
+                    if not put(batch):
+                        break
+                    batch = []
+                if stop.is_set():
+                    break
+            if batch:
+                put(batch)
+        finally:
+            # Close the source file or socket from the reading thread
+            if hasattr(source, "close"):
+                source.close()
+            put(None)
+
+    # Start the reader
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+
+    # Parse batches and feed the engine until the source ends
+    finished = False
+    try:
+        while True:
+            batch = batches.get()
+            if batch is None:
+                break
+            blocks, dropped = record_parser(batch, channels)
+            refit = False
+            for name, block in blocks:
+                refit = engine.append(name, *block) or refit
+            yield (sum(len(block[0]) for _, block in blocks), dropped, refit)
+        thread.join()
+        finished = True
+    finally:
+        # Stop the reader when the consumer exits early, it releases the
+        # source at its next line or poll
+        if not finished:
+            stop.set()
+            while not batches.empty():
+                batches.get_nowait()
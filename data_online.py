@@ -0,0 +1,244 @@
+"""
+This is the online update script of the radio data analysis project.
+
+Created on Sun Oct 18 2026
+
+@author: Yang-Taotao
+"""
+# %% Library import
+# Library import
+import numpy as np
+
+# Custom module import
+from data_handler import validator, freq_grouper
+from data_reader import time_index, time_key
+from data_fitter import gyro_fitter, plas_fitter, gyro_pass
+
+# %% Online engine
+# Incremental analysis engine
+class OnlineEngine:
+    """
+    Incremental engine for appended NoRP and RSTN observations, keeping
+    running quiet sun statistics, peak tracking, and the latest combined
+    spectrum with its fits up to date in O(block) per append.
+
+    Parameters
+    ----------
+    arg_freq : tuple
+        Tuple of NoRP, apl, and phf freq arrays.
+    freq_cut : float, optional
+        Cut-off freq between plas and gyro fits. The default is 2.
+    buffer : float, optional
+        Seconds of samples kept per instrument before the latest time
+        common to all instruments, nothing is trimmed until every
+        instrument has data. The default is 10.
+    rtol : float, optional
+        Relative spectrum change that triggers a refit. The default is 1e-3.
+    max_lag : float, optional
+        Hard cap in seconds on the samples kept behind each instrument's
+        own latest time, a feed lagging further pauses refits until it
+        catches up. The default is 60.
+    """
+
+    # Instrument repo
+    names = ("norp", "apl", "phf")
+
+    def __init__(
+        self, arg_freq, freq_cut=2, buffer=10, rtol=1e-3, max_lag=60
+    ):
+        # Configuration repo
+        self.freq = dict(zip(type(self).names, arg_freq))
+        self.freq_cut, self.buffer, self.rtol = freq_cut, buffer, rtol
+        self.max_lag = max(max_lag, buffer)
+
+        # Running state per instrument
+        self.count = dict.fromkeys(type(self).names, 0)
+        self.mean = {name: 0.0 for name in type(self).names}
+        self.m2 = {name: 0.0 for name in type(self).names}
+        self.peak = dict.fromkeys(type(self).names)
+        self.tail = dict.fromkeys(type(self).names)
+
+        # Latest spectrum and fit repo
+        self.spectrum, self.fits = None, None
+
+    def append(self, name, data_tim, data_fi, data_mvd=None):
+        """
+        Parameters
+        ----------
+        name : string
+            Instrument name, "norp", "apl", or "phf".
+        data_tim : array
+            Time array of the new block.
+        data_fi : array
+            Flux array of the new block.
+        data_mvd : array, optional
+            Validity array of the new block. The default is None, all valid.
+
+        Returns
+        -------
+        refit : bool
+            The combined spectrum changed and was refitted.
+        """
+        # Validity filter of the new block
+        if data_mvd is not None:
+            data_tim, data_fi = validator(data_mvd, data_tim, data_fi)
+        data_fi = np.asarray(data_fi, dtype=np.float64)
+        if not len(data_tim):
+            return False
+
+        # Merge block mean and squared deviations into the running state
+        count_a, count_b = self.count[name], data_fi.shape[0]
+        mean_b = np.mean(data_fi, axis=0)
+        delta = mean_b - self.mean[name]
+        self.count[name] = count_a + count_b
+        self.mean[name] = self.mean[name] + delta * count_b / self.count[name]
+        self.m2[name] = (
+            self.m2[name]
+            + np.sum((data_fi - mean_b) ** 2, axis=0)
+            + delta**2 * count_a * count_b / self.count[name]
+        )
+
+        # Peak tracking on the channel summed flux, the quiet sun mean
+        # shifts every row equally so raw sums rank the same
+        idx = int(np.argmax(np.sum(data_fi, axis=1)))
+        if self.peak[name] is None or (
+            np.sum(data_fi[idx]) > np.sum(self.peak[name][1])
+        ):
+            self.peak[name] = (data_tim[idx], data_fi[idx].copy())
+
+        # Append the block to the recent samples
+        self.tail[name] = (
+            (data_tim, data_fi)
+            if self.tail[name] is None
+            else (
+                np.concatenate([self.tail[name][0], data_tim]),
+                np.concatenate([self.tail[name][1], data_fi]),
+            )
+        )
+
+        # Keep the samples inside the buffer before the latest time common
+        # to all instruments, so a lagging feed still finds its seconds,
+        # but never more than max_lag behind each instrument's own latest
+        common = (
+            min(time_key(tail[0][-1]) for tail in self.tail.values())
+            if all(tail is not None for tail in self.tail.values())
+            else None
+        )
+        for key, tail in self.tail.items():
+            if tail is None:
+                continue
+            tail_key = time_key(tail[0])
+            limit = tail_key[-1] - self.max_lag * 1000
+            if common is not None:
+                limit = max(limit, common - self.buffer * 1000)
+            keep = tail_key > limit
+            self.tail[key] = (tail[0][keep], tail[1][keep])
+
+        # Return refit status of the latest combined spectrum
+        return self.refresh()
+
+    def variance(self, name):
+        """
+        Parameters
+        ----------
+        name : string
+            Instrument name.
+
+        Returns
+        -------
+        var : array
+            Running flux variance per freq channel.
+        """
+        # Return sample variance
+        return self.m2[name] / max(self.count[name] - 1, 1)
+
+    def peaks(self):
+        """
+        Returns
+        -------
+        peaks : dict
+            Peak time and quiet sun subtracted peak flux per instrument.
+        """
+        # Return peaks against the current quiet sun mean
+        return {
+            name: (peak[0], peak[1] - self.mean[name])
+            for name, peak in self.peak.items()
+            if peak is not None
+        }
+
+    def latest(self):
+        """
+        Returns
+        -------
+        spectrum : tuple or None
+            Time, freq, and quiet sun subtracted combined flux at the
+            latest second recorded by every instrument, None until all
+            instruments have data.
+        """
+        # Wait for every instrument
+        if any(tail is None for tail in self.tail.values()):
+            return None
+
+        # Latest second common to all recent samples
+        data_time = min(
+            tail[0][-1].astype("datetime64[s]") for tail in self.tail.values()
+        )
+
+        # Quiet sun subtracted rows of that second
+        data_flux = []
+        for name in type(self).names:
+            idx = int(time_index(self.tail[name][0]).within(data_time))
+            if idx < 0:
+                return None
+            data_flux.append(self.tail[name][1][idx] - self.mean[name])
+
+        # Return combined spectrum
+        data_freq, data_flux = freq_grouper(
+            np.concatenate([self.freq[name] for name in type(self).names]),
+            np.concatenate(data_flux),
+        )[:2]
+        return (data_time, data_freq, data_flux)
+
+    def refresh(self):
+        """
+        Returns
+        -------
+        refit : bool
+            The combined spectrum changed and was refitted.
+        """
+        # Latest combined spectrum
+        spectrum = self.latest()
+        if spectrum is None:
+            return False
+
+        # Skip the refit for an unchanged spectrum
+        if self.spectrum is not None and np.allclose(
+            spectrum[2], self.spectrum[2], rtol=self.rtol, atol=0
+        ):
+            return False
+        self.spectrum = spectrum
+
+        # Refit gyro, plas, and denoised gyro models
+        _, data_freq, data_flux = spectrum
+        try:
+            results_plas = plas_fitter(
+                data_freq, data_flux, self.freq_cut, verbose=False
+            )
+            self.fits = (
+                gyro_fitter(data_freq, data_flux, "Online", verbose=False),
+                results_plas,
+                gyro_fitter(
+                    data_freq,
+                    gyro_pass(
+                        data_freq, data_flux, self.freq_cut, results_plas[0]
+                    ),
+                    "Online denoised",
+                    verbose=False,
+                ),
+            )
+        except (RuntimeError, ValueError):
+            # Keep monitoring through spectra the models cannot fit
+            self.fits = None
+
+        # Return refit status
+        return True
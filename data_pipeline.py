@@ -0,0 +1,707 @@
+"""
+This is the pipeline script of the radio data analysis project.
+
+Created on Sun Oct 18 2026
+
+@author: Yang-Taotao
+"""
+# %% Library import
+# Library import
+import os
+import csv
+import time
+import pickle
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Custom module import
+from data_handler import loader, validator, quiet_sun, collector
+from data_reader import file_signature, time_index, TimeIndex
+from data_fitter import gyro_fitter, plas_fitter, gyro_pass
+from data_plotter import plot_generator
+
+# %% Plot output layout
+# Media files written by plot_generator
+PLOT_FILES = (
+    "./media/figure_01_norp.png",
+    "./media/figure_02_rstn.png",
+    "./media/figure_03_combined.png",
+    "./media/figure_03_peak_average_combined.png",
+    "./media/figure_03_peak_time.png",
+    "./media/figure_04_denoised.png",
+)
+
+# %% Batch table layout
+# Fit result columns of the batch table
+BATCH_PARAM = (
+    ("gyro", ("A", "B", "a", "b")),
+    ("plas", ("c", "k")),
+    ("denoise", ("A", "B", "a", "b")),
+)
+
+# Batch table columns
+BATCH_COLUMNS = (
+    ("job", "data_dir", "peak_time", "freq_cut", "status", "error", "time")
+    + tuple(
+        f"{fit}_{name}" for fit, names in BATCH_PARAM for name in names
+    )
+    + tuple(f"{fit}_chi_sqr" for fit, _ in BATCH_PARAM)
+)
+
+
+# %% Single event pipeline
+# Data path generator
+def pipeline_path(data_dir):
+    """
+    Parameters
+    ----------
+    data_dir : string or tuple
+        Event data folder holding norp, apl, and phf folders, or a tuple
+        of the three instrument paths.
+
+    Returns
+    -------
+    data_path : tuple
+        Tuple of data folder path.
+    """
+    # Keep explicit instrument paths
+    if not isinstance(data_dir, str):
+        return tuple(data_dir)
+
+    # Return instrument folders of the event folder
+    data_dir = data_dir.rstrip("/") + "/"
+    return (data_dir + "norp/", data_dir + "apl/", data_dir + "phf/")
+
+
+# Single event pipeline runner
+def pipeline_runner(
+    data_dir, peak_time, freq_cut, verbose=False, policy="default"
+):
+    """
+    Parameters
+    ----------
+    data_dir : string or tuple
+        Event data folder, or tuple of data folder path.
+    peak_time : string
+        Peak time of the event.
+    freq_cut : float
+        Cut-off freq between plas and gyro fits.
+    verbose : bool, optional
+        Print the fit results. The default is False.
+    policy : string or dict, optional
+        Dtype policy of flux and validity arrays, see DTYPE_POLICY.
+        The default is "default".
+
+    Returns
+    -------
+    results : tuple
+        Gyro, plas, and denoised gyro fit results.
+    """
+    # Load csv data into data repo
+    (
+        norp_fi,
+        norp_freq,
+        norp_mvd,
+        norp_tim,
+        apl_fi,
+        apl_freq,
+        apl_tim,
+        phf_fi,
+        phf_freq,
+        phf_tim,
+    ) = loader(pipeline_path(data_dir), policy=policy)
+
+    # NoRP validity filter and shared time index
+    norp_tim_valid, norp_fi_valid = validator(norp_mvd, norp_tim, norp_fi)
+
+    # Quiet sun subtraction
+    norp_fi_peak, apl_fi_peak, phf_fi_peak = quiet_sun(
+        (norp_fi_valid, apl_fi, phf_fi)
+    )
+
+    # Peak time combined spectrum
+    peak_time_freq, peak_time_flux = collector(
+        (
+            time_index(norp_tim_valid),
+            time_index(apl_tim),
+            time_index(phf_tim),
+            peak_time,
+        ),
+        (norp_freq, apl_freq, phf_freq),
+        (norp_fi_peak, apl_fi_peak, phf_fi_peak),
+    )
+
+    # Gyro and plas fits
+    results_gyro, results_plas = (
+        gyro_fitter(peak_time_freq, peak_time_flux, "Initial", verbose),
+        plas_fitter(peak_time_freq, peak_time_flux, freq_cut, verbose),
+    )
+
+    # Refit with low freq denoised data
+    results_denoise = gyro_fitter(
+        peak_time_freq,
+        gyro_pass(peak_time_freq, peak_time_flux, freq_cut, results_plas[0]),
+        "Denoised",
+        verbose,
+    )
+
+    # Return fit results
+    return (results_gyro, results_plas, results_denoise)
+
+
+# %% Batch runner
+# Single batch job runner
+def batch_job(arg):
+    """
+    Parameters
+    ----------
+    arg : tuple
+        Job number and (data directory, peak time, freq_cut) job.
+
+    Returns
+    -------
+    row : dict
+        Batch table row of the job.
+    """
+    # Local variable repo
+    job, (data_dir, peak_time, freq_cut) = arg
+    row = dict.fromkeys(BATCH_COLUMNS, float("nan"))
+    row.update(
+        job=job,
+        data_dir=str(data_dir),
+        peak_time=str(peak_time),
+        freq_cut=freq_cut,
+        status="ok",
+        error="",
+    )
+
+    # Run the pipeline, record failures instead of raising
+    time_start = time.perf_counter()
+    try:
+        results = pipeline_runner(data_dir, peak_time, freq_cut)
+    except Exception as error:  # pylint: disable=broad-except
+        row.update(status="failed", error=f"{type(error).__name__}: {error}")
+        results = ()
+    row["time"] = time.perf_counter() - time_start
+
+    # Deposit fit parameters and chi2 values
+    for (fit, names), result in zip(BATCH_PARAM, results):
+        row.update(zip((f"{fit}_{name}" for name in names), result[0]))
+        row[f"{fit}_chi_sqr"] = result[2]
+
+    # Return table row
+    return row
+
+
+# Multi event batch runner
+def batch_runner(jobs, workers=None):
+    """
+    Parameters
+    ----------
+    jobs : iterable
+        Tuples of (data directory, peak time, freq_cut).
+    workers : integer, optional
+        Number of worker processes. The default is None, one per core.
+
+    Returns
+    -------
+    table : list
+        Batch table rows in job order, one dict per job.
+    """
+    # Number the jobs to keep the table order
+    args = list(enumerate(jobs))
+
+    # Run jobs on a process pool
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(batch_job, arg) for arg in args]
+
+    # Collect rows, pool failures are recorded per job
+    table = []
+    for (job, (data_dir, peak_time, freq_cut)), future in zip(args, futures):
+        try:
+            table.append(future.result())
+        except Exception as error:  # pylint: disable=broad-except
+            row = dict.fromkeys(BATCH_COLUMNS, float("nan"))
+            row.update(
+                job=job,
+                data_dir=str(data_dir),
+                peak_time=str(peak_time),
+                freq_cut=freq_cut,
+                status="failed",
+                error=repr(error),
+            )
+            table.append(row)
+
+    # Return batch table
+    return table
+
+
+# Batch table writer
+def batch_writer(table, file_path):
+    """
+    Parameters
+    ----------
+    table : list
+        Batch table rows from batch_runner.
+    file_path : string
+        Path to output CSV file.
+
+    Returns
+    -------
+    None.
+    """
+    # Write table rows as CSV
+    with open(file_path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, fieldnames=BATCH_COLUMNS)
+        writer.writeheader()
+        writer.writerows(table)
+
+
+# %% Stage cache
+# Stage cache version, bump to invalidate stored outputs by hand
+CACHE_VERSION = 1
+
+# Project modules whose code shapes stage outputs
+CACHE_MODULES = (
+    "data_reader.py",
+    "data_handler.py",
+    "data_fitter.py",
+    "data_plotter.py",
+    "data_pipeline.py",
+)
+
+
+# Stage code signature
+def code_signature(modules=CACHE_MODULES):
+    """
+    Parameters
+    ----------
+    modules : tuple, optional
+        Module file names next to this script. The default is
+        CACHE_MODULES.
+
+    Returns
+    -------
+    signature : string
+        Hash of the cache version and the module sources, any code change
+        gives a new signature.
+    """
+    # Hash the version and every module source
+    digest = hashlib.blake2b(f"v{CACHE_VERSION}".encode(), digest_size=20)
+    for module in modules:
+        with open(
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), module),
+            "rb",
+        ) as file:
+            digest.update(module.encode())
+            digest.update(file.read())
+
+    # Return code signature
+    return digest.hexdigest()
+
+
+# Stage input hasher
+def stage_hash(obj, digest):
+    """
+    Parameters
+    ----------
+    obj : object
+        Stage input, a scalar, string, array, time index, or nested tuple.
+    digest : hash object
+        Hash object updated in place.
+
+    Returns
+    -------
+    None.
+    """
+    # Hash arrays by dtype, shape, and content
+    if isinstance(obj, TimeIndex):
+        obj = obj.tim
+    if isinstance(obj, np.ndarray):
+        digest.update(f"array{obj.dtype.str}{obj.shape}".encode())
+        digest.update(np.ascontiguousarray(obj).tobytes())
+    # Hash containers element by element
+    elif isinstance(obj, (tuple, list)):
+        digest.update(f"seq{len(obj)}".encode())
+        for item in obj:
+            stage_hash(item, digest)
+    elif isinstance(obj, dict):
+        stage_hash(sorted(obj.items()), digest)
+    # Hash scalars and strings by type and repr
+    else:
+        digest.update(f"{type(obj).__name__}:{obj!r}".encode())
+
+
+# Memoized pipeline stage
+class Stage:
+    """
+    Memoized pipeline stage, computed or loaded from disk on first access.
+
+    Parameters
+    ----------
+    cache : StageCache
+        Stage cache holding the stored outputs.
+    key : string
+        Content hash of the stage inputs and parameters.
+    func : callable
+        Stage function.
+    args : tuple
+        Stage arguments, upstream Stage objects are resolved first.
+    """
+
+    def __init__(self, cache, key, func, args):
+        # Stage repo
+        self.cache, self.key, self.func, self.args = cache, key, func, args
+        self.resolved, self.result = False, None
+
+    @property
+    def value(self):
+        """
+        Returns
+        -------
+        value : object
+            Stage output, loaded from disk or recomputed on a miss.
+        """
+        # Resolve the stage only once
+        if not self.resolved:
+            hit, self.result = self.cache.get(self.key)
+            if not hit:
+                self.result = self.func(
+                    *[
+                        arg.value if isinstance(arg, Stage) else arg
+                        for arg in self.args
+                    ]
+                )
+                self.cache.put(self.key, self.result)
+            self.resolved = True
+
+        # Return stage output
+        return self.result
+
+
+# Content addressed stage cache
+class StageCache:
+    """
+    On-disk stage cache keyed by a hash of the stage inputs, evicted in
+    least recently used order under a size cap.
+
+    Parameters
+    ----------
+    cache_dir : string, optional
+        Cache folder path. The default is "./.cache/".
+    max_bytes : integer, optional
+        Size cap of the cache folder. The default is 1 GB.
+    salt : string, optional
+        Key salt of the stage code. The default is None, code_signature,
+        so entries stored by older code are never served.
+    """
+
+    def __init__(self, cache_dir="./.cache/", max_bytes=1 << 30, salt=None):
+        # Cache repo
+        self.cache_dir, self.max_bytes = cache_dir, max_bytes
+        self.salt = code_signature() if salt is None else salt
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key):
+        # Return stored output path of a key
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def stage(self, name, func, *args, params=()):
+        """
+        Parameters
+        ----------
+        name : string
+            Stage name.
+        func : callable
+            Stage function.
+        *args : object
+            Stage arguments, upstream stages are hashed by their key.
+        params : tuple, optional
+            Extra key inputs not passed to func. The default is ().
+
+        Returns
+        -------
+        stage : Stage
+            Lazy memoized stage.
+        """
+        # Chain the code salt and upstream keys instead of rehashing their
+        # outputs
+        digest = hashlib.blake2b(name.encode(), digest_size=20)
+        digest.update(self.salt.encode())
+        for arg in args + (params,):
+            if isinstance(arg, Stage):
+                digest.update(arg.key.encode())
+            else:
+                stage_hash(arg, digest)
+
+        # Return lazy stage
+        return Stage(self, digest.hexdigest(), func, args)
+
+    def get(self, key):
+        """
+        Parameters
+        ----------
+        key : string
+            Stage key.
+
+        Returns
+        -------
+        hit : bool
+            Stage output was found.
+        value : object
+            Stored stage output, None on a miss.
+        """
+        # Load stored output and refresh its LRU time
+        try:
+            with open(self.path(key), "rb") as file:
+                value = pickle.load(file)
+            os.utime(self.path(key))
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return (False, None)
+
+        # Return hit result
+        return (True, value)
+
+    def put(self, key, value):
+        """
+        Parameters
+        ----------
+        key : string
+            Stage key.
+        value : object
+            Stage output.
+
+        Returns
+        -------
+        None.
+        """
+        # Write through a temp file so a partial output is never read
+        with open(self.path(key) + ".tmp", "wb") as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(self.path(key) + ".tmp", self.path(key))
+
+        # Evict least recently used outputs above the size cap
+        self.evict()
+
+    def evict(self):
+        """
+        Returns
+        -------
+        None.
+        """
+        # Stored outputs from least to most recently used
+        entries = sorted(
+            (entry.stat().st_mtime_ns, entry.stat().st_size, entry.path)
+            for entry in os.scandir(self.cache_dir)
+            if entry.name.endswith(".pkl")
+        )
+
+        # Drop oldest outputs until under the cap
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+
+# %% Cached single event pipeline
+# Data folder signature
+def pipeline_signature(data_path):
+    """
+    Parameters
+    ----------
+    data_path : tuple
+        Tuple of data folder path.
+
+    Returns
+    -------
+    signature : tuple
+        Name, size, and mtime of every data file.
+    """
+    # Data files of each folder, or the native RSTN file itself
+    files = []
+    for path in data_path:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name)
+                for name in sorted(os.listdir(path))
+                if ".cache." not in name
+            )
+        else:
+            files.append(path)
+
+    # Return file signatures
+    return tuple(
+        (file, *file_signature(file).values())
+        for file in files
+        if os.path.isfile(file)
+    )
+
+
+# Plot stage runner
+def plot_stage(data_qs, data_coll, results, peak_time, freq_cut):
+    """
+    Parameters
+    ----------
+    data_qs : tuple
+        Validated time indices, freq, and quiet sun flux arrays.
+    data_coll : tuple
+        Peak time freq and flux arrays.
+    results : tuple
+        Gyro, plas, denoised flux, and denoised gyro fit results.
+    peak_time : string
+        Peak time of the event.
+    freq_cut : float
+        Cut-off freq between plas and gyro fits.
+
+    Returns
+    -------
+    media : dict
+        Plot file path and content bytes.
+    """
+    # Local variable repo
+    (tims, freqs, fluxes), (peak_freq, peak_flux) = data_qs, data_coll
+    results_gyro, results_plas, denoise_flux, results_denoise = results
+
+    # Plot generation
+    plot_generator(
+        (
+            (tims[0], fluxes[0], freqs[0], peak_time),
+            (*tims[1:], *fluxes[1:], *freqs[1:], peak_time),
+            (*tims, *fluxes, *freqs, peak_time),
+            (
+                peak_freq,
+                peak_flux,
+                peak_time,
+                results_gyro[0],
+                results_plas[0],
+                freq_cut,
+            ),
+            (
+                peak_freq,
+                denoise_flux,
+                peak_time,
+                results_denoise[0],
+                results_plas[0],
+            ),
+        )
+    )
+
+    # Return plot file content
+    media = {}
+    for path in PLOT_FILES:
+        with open(path, "rb") as file:
+            media[path] = file.read()
+    return media
+
+
+# Cached single event pipeline runner
+def cached_runner(
+    data_dir, peak_time, freq_cut, cache=None, plot=False, verbose=False
+):
+    """
+    Parameters
+    ----------
+    data_dir : string or tuple
+        Event data folder, or tuple of data folder path.
+    peak_time : string
+        Peak time of the event.
+    freq_cut : float
+        Cut-off freq between plas and gyro fits.
+    cache : StageCache, optional
+        Stage cache. The default is None, a cache in "./.cache/".
+    plot : bool, optional
+        Generate plots. The default is False.
+    verbose : bool, optional
+        Print the fit results of recomputed fits. The default is False.
+
+    Returns
+    -------
+    results : tuple
+        Gyro, plas, and denoised gyro fit results.
+    """
+    # Local variable repo
+    cache = StageCache() if cache is None else cache
+    data_path = pipeline_path(data_dir)
+
+    # Loader stage keyed by data file signatures
+    stage_load = cache.stage(
+        "loader", loader, data_path, params=pipeline_signature(data_path)
+    )
+
+    # Validator stage
+    stage_valid = cache.stage(
+        "validator",
+        lambda repo: validator(repo[2], repo[3], repo[0]),
+        stage_load,
+    )
+
+    # Quiet sun stage with shared time indices
+    stage_qs = cache.stage(
+        "quiet_sun",
+        lambda repo, valid: (
+            tuple(time_index(tim) for tim in (valid[0], repo[6], repo[9])),
+            (repo[1], repo[5], repo[8]),
+            quiet_sun((valid[1], repo[4], repo[7])),
+        ),
+        stage_load,
+        stage_valid,
+    )
+
+    # Collector stage
+    stage_coll = cache.stage(
+        "collector",
+        lambda data: collector((*data[0], peak_time), data[1], data[2]),
+        stage_qs,
+        params=peak_time,
+    )
+
+    # Fitter stages
+    stage_gyro = cache.stage(
+        "gyro_fitter",
+        lambda data: gyro_fitter(*data, "Initial", verbose),
+        stage_coll,
+    )
+    stage_plas = cache.stage(
+        "plas_fitter",
+        lambda data: plas_fitter(*data, freq_cut, verbose),
+        stage_coll,
+        params=freq_cut,
+    )
+    stage_pass = cache.stage(
+        "gyro_pass",
+        lambda data, plas: gyro_pass(*data, freq_cut, plas[0]),
+        stage_coll,
+        stage_plas,
+        params=freq_cut,
+    )
+    stage_denoise = cache.stage(
+        "gyro_fitter",
+        lambda data, flux: gyro_fitter(data[0], flux, "Denoised", verbose),
+        stage_coll,
+        stage_pass,
+    )
+
+    # Plotter stage, restore plot files from the cache on a hit
+    if plot:
+        stage_plot = cache.stage(
+            "plot_generator",
+            lambda data, coll, *fits: plot_stage(
+                data, coll, fits, peak_time, freq_cut
+            ),
+            stage_qs,
+            stage_coll,
+            stage_gyro,
+            stage_plas,
+            stage_pass,
+            stage_denoise,
+            params=(peak_time, freq_cut),
+        )
+        for path, content in stage_plot.value.items():
+            with open(path, "wb") as file:
+                file.write(content)
+
+    # Return fit results
+    return (stage_gyro.value, stage_plas.value, stage_denoise.value)
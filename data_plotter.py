@@ -12,14 +12,82 @@ import matplotlib.pyplot as plt
 import scienceplots
 
 # Custom module import
+from data_reader import time_label, time_index
+from data_handler import time_grid, resampler
 from data_fitter import gyro_model, plas_model, fit_label
 
 # %%  Plot style config
 # Plot style configuration
 plt.style.use(["science", "notebook", "grid"])
 
+# %% Peak window resampler
+# Peak window bin generator
+def peak_window(data_tim, data_flux, data_peak_time, span, width):
+    """
+    Parameters
+    ----------
+    data_tim : array or TimeIndex
+        Time array or time index of the instrument.
+    data_flux : array
+        Flux array of the instrument.
+    data_peak_time : string
+        Peak time of the flux recording.
+    span : float
+        Window half width around the peak in seconds.
+    width : float
+        Bin width in seconds.
+
+    Returns
+    -------
+    data_bins : array
+        Start times of the non-empty bins.
+    data_flux_mean : array
+        Mean flux of the non-empty bins.
+    """
+    # Peak sample time from the shared time index
+    index = time_index(data_tim)
+    peak = index[index.locate(data_peak_time)]
+    span = np.timedelta64(int(span * 1000), "ms")
+
+    # Resample the window onto the bin grid
+    data_bins, data_flux_mean, data_count = resampler(
+        index, data_flux, time_grid(peak - span, peak + span, width)
+    )
+
+    # Return non-empty bins
+    return (data_bins[data_count > 0], data_flux_mean[data_count > 0])
+
+
+# Peak window range generator
+def peak_range(data_tim, data_peak_time, span):
+    """
+    Parameters
+    ----------
+    data_tim : array or TimeIndex
+        Time array or time index of the instrument.
+    data_peak_time : string
+        Peak time of the flux recording.
+    span : float
+        Window half width around the peak in seconds.
+
+    Returns
+    -------
+    peak : integer
+        Peak time array index.
+    peak_slice : slice or array
+        Time array rows inside the window.
+    """
+    # Peak sample time from the shared time index
+    index = time_index(data_tim)
+    peak = index.locate(data_peak_time)
+    span = np.timedelta64(int(span * 1000), "ms")
+
+    # Return peak index and window rows
+    return (peak, index.range(index[peak] - span, index[peak] + span))
+
+
 # %% NoRP plotter
-# NoRP log log plotter - flux vs freq at each time - 100 index = 10 s
+# NoRP log log plotter - flux vs freq at each time - 15 s bins
 def norp_plotter(arg):
     """
     Parameters
@@ -39,32 +107,21 @@ def norp_plotter(arg):
         data_norp_peak_time,
     ) = [arg[i] for i in range(len(arg))]
 
-    # Plot range limiter
-    # Gain peak value time array index
-    peak = (
-        np.where(data_norp_tim_valid == data_norp_peak_time)[0][0],  # peak
-        300,  # peak_gap
-        150,  # gap
-    )
-    # Plot data range limiter at +- 30s --> peak_gap >= 300
-    # Structure - (peak_start, peak_end)
-    peak_idx = (
-        max(0, peak[0] - peak[1]),  # peak_start
-        min(data_norp_fi_peak.shape[0], peak[0] + peak[1]),  # peak_end
+    # Plot range limiter at +- 30s in 15s bins
+    data_norp_bins, data_norp_mean = peak_window(
+        data_norp_tim_valid, data_norp_fi_peak, data_norp_peak_time, 30, 15
     )
 
     # Plot with loops
     plt_0 = [
         plt.plot(
             data_norp_freq,
-            np.mean(
-                data_norp_fi_peak[i : i + peak[2]], axis=0
-            ),  # Mean data calculator
+            data_norp_mean[i],
             "+-",
             markersize=10,
-            label="NoRP " + data_norp_tim_valid[i],
+            label="NoRP " + time_label(data_norp_bins[i]),
         )
-        for i in range(peak_idx[0], peak_idx[1], peak[2])
+        for i in range(len(data_norp_bins))
     ]
 
     # Plot axis scale definer
@@ -85,7 +142,7 @@ def norp_plotter(arg):
 
 
 # %% RSTN plotter
-# RSTN log log plotter - flux vs freq at each time - 200 index = 190 s
+# RSTN log log plotter - flux vs freq at each time - 60 s bins
 def rstn_plotter(arg):
     """
     Parameters
@@ -108,20 +165,14 @@ def rstn_plotter(arg):
         data_norp_peak_time,
     ) = [arg[i] for i in range(len(arg))]
 
-    # Plot range limiter
-    # Gain peak value time array index
-    peak = (
-        np.where(data_apl_tim == data_norp_peak_time)[0][0],  # peak_apl
-        np.where(data_phf_tim == data_norp_peak_time)[0][0],  # peak_phf
-        60,  # peak_gap
-        60,  # gap
-    )
-    # Plot data range limiter at +- 30s
-    peak_idx = (
-        max(0, peak[0] - peak[2]),  # peak_apl_start
-        min(data_apl_fi_peak.shape[0], peak[0] + peak[2]),  # peak_apl_end
-        max(0, peak[1] - peak[2]),  # peak_phf_start
-        min(data_phf_fi_peak.shape[0], peak[1] + peak[2]),  # peak_phf_end
+    # Plot range limiter at +- 60s in 60s bins
+    (data_apl_bins, data_apl_mean), (data_phf_bins, data_phf_mean) = (
+        peak_window(
+            data_apl_tim, data_apl_fi_peak, data_norp_peak_time, 60, 60
+        ),
+        peak_window(
+            data_phf_tim, data_phf_fi_peak, data_norp_peak_time, 60, 60
+        ),
     )
 
     # Plot generation
@@ -129,28 +180,24 @@ def rstn_plotter(arg):
     plt_0 = [
         plt.plot(
             data_apl_freq,
-            np.mean(
-                data_apl_fi_peak[i : i + peak[3]], axis=0
-            ),  # Mean data calculator
+            data_apl_mean[i],
             "x-",
             markersize=10,
-            label="RSTN_apl " + data_apl_tim[i],
+            label="RSTN_apl " + time_label(data_apl_bins[i]),
         )
-        for i in range(peak_idx[0], peak_idx[1], peak[3])
+        for i in range(len(data_apl_bins))
     ]
     # Plot phf with loops
     plt_1 = [
         plt.plot(
             data_phf_freq,
-            np.mean(
-                data_phf_fi_peak[i : i + peak[3]], axis=0
-            ),  # Mean data calculator
+            data_phf_mean[i],
             "o-",
             markerfacecolor="none",
             markersize=10,
-            label="RSTN_phf " + data_phf_tim[i],
+            label="RSTN_phf " + time_label(data_phf_bins[i]),
         )
-        for i in range(peak_idx[2], peak_idx[3], peak[3])
+        for i in range(len(data_phf_bins))
     ]
 
     # Plot axis scale definer
@@ -197,25 +244,21 @@ def log_plotter(arg):
         data_norp_peak_time,
     ) = [arg[i] for i in range(len(arg))]
 
-    # Plot range limiter
-    # Gain peak value time array index
-    peak = (
-        np.where(data_norp_tim_valid == data_norp_peak_time)[0][0],  # peak
-        np.where(data_apl_tim == data_norp_peak_time)[0][0],  # peak_apl
-        np.where(data_phf_tim == data_norp_peak_time)[0][0],  # peak_phf
-        300,  # peak_norp_gap
-        60,  # peak_rstn_gap
-        150,  # gap_norp
-        60,  # gap_rstn
-    )
-    # Plot data range limiter at +- 30s
-    peak_idx = (
-        max(0, peak[0] - peak[3]),  # peak_start
-        min(data_norp_fi_peak.shape[0], peak[0] + peak[3]),  # peak_end
-        max(0, peak[1] - peak[4]),  # peak_apl_start
-        min(data_apl_fi_peak.shape[0], peak[1] + peak[4]),  # peak_apl_end
-        max(0, peak[2] - peak[4]),  # peak_phf_start
-        min(data_phf_fi_peak.shape[0], peak[2] + peak[4]),  # peak_phf_end
+    # Plot range limiter at +- 30s in 15s NoRP bins, 60s RSTN bins
+    (
+        (data_norp_bins, data_norp_mean),
+        (data_apl_bins, data_apl_mean),
+        (data_phf_bins, data_phf_mean),
+    ) = (
+        peak_window(
+            data_norp_tim_valid, data_norp_fi_peak, data_norp_peak_time, 30, 15
+        ),
+        peak_window(
+            data_apl_tim, data_apl_fi_peak, data_norp_peak_time, 60, 60
+        ),
+        peak_window(
+            data_phf_tim, data_phf_fi_peak, data_norp_peak_time, 60, 60
+        ),
     )
 
     # Plot generation
@@ -223,41 +266,35 @@ def log_plotter(arg):
     plt_0 = [
         plt.plot(
             data_norp_freq,
-            np.mean(
-                data_norp_fi_peak[i : i + peak[5]], axis=0
-            ),  # Mean data calculator
+            data_norp_mean[i],
             "+-",
             markersize=10,
-            label="NoRP " + data_norp_tim_valid[i],
+            label="NoRP " + time_label(data_norp_bins[i]),
         )
-        for i in range(peak_idx[0], peak_idx[1], peak[5])
+        for i in range(len(data_norp_bins))
     ]
     # Plot apl with loops
     plt_1 = [
         plt.plot(
             data_apl_freq,
-            np.mean(
-                data_apl_fi_peak[i : i + peak[6]], axis=0
-            ),  # Mean data calculator
+            data_apl_mean[i],
             "x-",
             markersize=10,
-            label="RSTN_apl " + data_apl_tim[i],
+            label="RSTN_apl " + time_label(data_apl_bins[i]),
         )
-        for i in range(peak_idx[2], peak_idx[3], peak[6])
+        for i in range(len(data_apl_bins))
     ]
     # Plot phf with loops
     plt_2 = [
         plt.plot(
             data_phf_freq,
-            np.mean(
-                data_phf_fi_peak[i : i + peak[6]], axis=0
-            ),  # Mean data calculator
+            data_phf_mean[i],
             "o-",
             markerfacecolor="none",
             markersize=10,
-            label="RSTN_phf " + data_phf_tim[i],
+            label="RSTN_phf " + time_label(data_phf_bins[i]),
         )
-        for i in range(peak_idx[4], peak_idx[5], peak[6])
+        for i in range(len(data_phf_bins))
     ]
 
     # Plot axis scale definer
@@ -304,32 +341,18 @@ def log_avg_plotter(arg):
         data_norp_peak_time,
     ) = [arg[i] for i in range(len(arg))]
 
-    # Plot range limiter
-    # Gain peak value time array index
-    peak = (
-        np.where(data_norp_tim_valid == data_norp_peak_time)[0][0],  # peak
-        np.where(data_apl_tim == data_norp_peak_time)[0][0],  # peak_apl
-        np.where(data_phf_tim == data_norp_peak_time)[0][0],  # peak_phf
-        300,  # peak_norp_gap
-        60,  # peak_rstn_gap
-        150,  # gap_norp
-        60,  # gap_rstn
-    )
-    # Plot data range limiter at +- 30s
-    peak_idx = (
-        max(0, peak[0] - peak[3]),  # peak_start
-        min(data_norp_fi_peak.shape[0], peak[0] + peak[3]),  # peak_end
-        max(0, peak[1] - peak[4]),  # peak_apl_start
-        min(data_apl_fi_peak.shape[0], peak[1] + peak[4]),  # peak_apl_end
-        max(0, peak[2] - peak[4]),  # peak_phf_start
-        min(data_phf_fi_peak.shape[0], peak[2] + peak[4]),  # peak_phf_end
+    # Plot range limiter at +- 30s for NoRP, +- 60s for RSTN
+    (peak_norp, slice_norp), (peak_apl, slice_apl), (peak_phf, slice_phf) = (
+        peak_range(data_norp_tim_valid, data_norp_peak_time, 30),
+        peak_range(data_apl_tim, data_norp_peak_time, 60),
+        peak_range(data_phf_tim, data_norp_peak_time, 60),
     )
 
     # Generate peak time averaged data array
     data_norp_peak_avg, data_apl_peak_avg, data_phf_peak_avg = (
-        data_norp_fi_peak[peak_idx[0] : peak_idx[1], :],
-        data_apl_fi_peak[peak_idx[2] : peak_idx[3], :],
-        data_phf_fi_peak[peak_idx[4] : peak_idx[5], :],
+        data_norp_fi_peak[slice_norp],
+        data_apl_fi_peak[slice_apl],
+        data_phf_fi_peak[slice_phf],
     )
 
     # Plot generation
@@ -339,7 +362,7 @@ def log_avg_plotter(arg):
         np.mean(data_norp_peak_avg, axis=0),
         "+-",
         markersize=10,
-        label="NoRP " + data_norp_tim_valid[peak[0]],
+        label="NoRP " + time_label(data_norp_tim_valid[peak_norp]),
     )
     # Plot apl with loops
     plt.plot(
@@ -347,7 +370,7 @@ def log_avg_plotter(arg):
         np.mean(data_apl_peak_avg, axis=0),
         "x-",
         markersize=10,
-        label="RSTN_apl " + data_apl_tim[peak[1]],
+        label="RSTN_apl " + time_label(data_apl_tim[peak_apl]),
     )
     # Plot phf with loops
     plt.plot(
@@ -356,7 +379,7 @@ def log_avg_plotter(arg):
         "o-",
         markerfacecolor="none",
         markersize=10,
-        label="RSTN_phf " + data_phf_tim[peak[2]],
+        label="RSTN_phf " + time_label(data_phf_tim[peak_phf]),
     )
 
     # Plot axis scale definer
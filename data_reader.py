@@ -7,19 +7,562 @@ Created on Wed Mar 15 2023
 """
 # %% Library import
 # Library import
-import datetime as dt
+import os
+import bz2
+import gzip
+import json
+import hashlib
+import itertools
 import numpy as np
 
+# %% Compressed file helpers
+# Compression repo - (extension, magic bytes, opener)
+COMPRESSION = (
+    (".gz", b"\x1f\x8b", gzip.open),
+    (".bz2", b"BZh", bz2.open),
+)
+
+
+# Data file path resolver
+def file_resolver(file_path):
+    """
+    Parameters
+    ----------
+    file_path : string
+        Path to data file, with or without compression extension.
+
+    Returns
+    -------
+    file_path : string
+        Path to the existing plain or compressed data file.
+    """
+    # Fall back to compressed siblings of a missing plain file
+    if not os.path.exists(file_path):
+        for ext, _, _ in COMPRESSION:
+            if os.path.exists(file_path + ext):
+                return file_path + ext
+
+    # Return resolved path
+    return file_path
+
+
+# Data file compression sniffer
+def file_compression(file_path):
+    """
+    Parameters
+    ----------
+    file_path : string
+        Path to the existing data file.
+
+    Returns
+    -------
+    compression : tuple or None
+        COMPRESSION entry matching the file magic bytes, None for a plain
+        file.
+    """
+    # Detect compression from magic bytes, whatever the file extension
+    with open(file_path, "rb") as file:
+        magic = file.read(4)
+    for entry in COMPRESSION:
+        if magic.startswith(entry[1]):
+            return entry
+
+    # Return plain file marker
+    return None
+
+
+# Data file opener
+def file_opener(file_path, mode="rb"):
+    """
+    Parameters
+    ----------
+    file_path : string
+        Path to data file, with or without compression extension.
+    mode : string, optional
+        File mode, "rb" or "rt". The default is "rb".
+
+    Returns
+    -------
+    file : file object
+        Streaming file object, decompressed on the fly when compressed.
+    """
+    # Local variable repo
+    file_path = file_resolver(file_path)
+    kwargs = {"encoding": "ascii"} if "t" in mode else {}
+
+    # Open compressed files through their sniffed opener
+    compression = file_compression(file_path)
+    if compression is not None:
+        return compression[2](file_path, mode, **kwargs)
+
+    # Return plain file object
+    return open(file_path, mode, **kwargs)
+
+
+# %% Cache sidecar helpers
+# File signature generator
+def file_signature(file_path, content=False):
+    """
+    Parameters
+    ----------
+    file_path : string
+        Path to data file.
+    content : bool, optional
+        Include the content hash of the file. The default is False.
+
+    Returns
+    -------
+    signature : dict
+        File size, modification time and optional content hash.
+    """
+    # Get file status readout
+    stat = os.stat(file_path)
+
+    # Size and mtime signature
+    signature = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+    # Content hash signature in 1 MB blocks
+    if content:
+        digest = hashlib.sha1()
+        with open(file_path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        signature["hash"] = digest.hexdigest()
+
+    # Return file signature
+    return signature
+
+
+# Cache sidecar path generator
+def cache_path(file_path):
+    """
+    Parameters
+    ----------
+    file_path : string
+        Path to data file.
+
+    Returns
+    -------
+    path_data : string
+        Path to binary cache sidecar.
+    path_meta : string
+        Path to cache metadata sidecar.
+    """
+    # Return sidecar paths next to the source file
+    return (file_path + ".cache.npy", file_path + ".cache.json")
+
+
+# Cache sidecar reader
+def cache_reader(file_path, dtype):
+    """
+    Parameters
+    ----------
+    file_path : string
+        Path to data file.
+    dtype : dtype
+        The dtype of assigned file.
+
+    Returns
+    -------
+    data : array or None
+        Memory-mapped cache array, None if the cache is missing or stale.
+    """
+    # Local path variable repo
+    path_data, path_meta = cache_path(file_path)
+
+    # Cache metadata readout
+    try:
+        with open(path_meta, "r", encoding="utf-8") as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    # Invalidate on dtype change
+    if meta.get("dtype") != np.dtype(dtype).str:
+        return None
+
+    # Validate source signature, fall back to content hash on size or mtime
+    signature = file_signature(file_path)
+    if (signature["size"], signature["mtime"]) != (
+        meta["size"],
+        meta["mtime"],
+    ):
+        if (
+            signature["size"] != meta["size"]
+            or file_signature(file_path, content=True)["hash"] != meta["hash"]
+        ):
+            return None
+
+        # Unchanged content, refresh the mtime to skip rehashing next run
+        meta["mtime"] = signature["mtime"]
+        try:
+            with open(path_meta, "w", encoding="utf-8") as file:
+                json.dump(meta, file)
+        except OSError:
+            pass
+
+    # Memory-map the binary cache copy-on-write, in-place edits stay private
+    try:
+        data = np.load(path_data, mmap_mode="c")
+    except (OSError, ValueError):
+        return None
+
+    # Return cached data array
+    return data
+
+
+# Cache sidecar writer
+def cache_writer(file_path, dtype, data):
+    """
+    Parameters
+    ----------
+    file_path : string
+        Path to data file.
+    dtype : dtype
+        The dtype of assigned file.
+    data : array
+        Parsed data array.
+
+    Returns
+    -------
+    None.
+    """
+    # Local path variable repo
+    path_data, path_meta = cache_path(file_path)
+
+    # Cache metadata with content hash
+    meta = file_signature(file_path, content=True)
+    meta["dtype"] = np.dtype(dtype).str
+
+    # Write through temp files so a partial cache is never read
+    try:
+        with open(path_data + ".tmp", "wb") as file:
+            np.save(file, data)
+        os.replace(path_data + ".tmp", path_data)
+        with open(path_meta + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+        os.replace(path_meta + ".tmp", path_meta)
+    except OSError:
+        # Read-only data folders simply run uncached
+        pass
+
+
+# %% Time decoder
+# Define start point of datetime at 1979-01-01 as day01
+TIME_ORIGIN = np.datetime64("1978-12-31", "ms")
+
+
+# Time array decoder
+def time_decoder(data):
+    """
+    Parameters
+    ----------
+    data : array
+        Raw time array with col0, col1: ms, days.
+
+    Returns
+    -------
+    data_tim : array
+        Time array in datetime64[ms], backed by int64 epoch milliseconds.
+    """
+    # Combine ms and days columns with integer array arithmetic
+    data_ms = (
+        data[:, 0].astype(np.int64) + data[:, 1].astype(np.int64) * 86400000
+    )
+
+    # Return offset from the time origin
+    return TIME_ORIGIN + data_ms
+
+
+# Time label formatter
+def time_label(data_tim):
+    """
+    Parameters
+    ----------
+    data_tim : datetime64 or array
+        Time value or time array.
+
+    Returns
+    -------
+    label : string or array
+        Time label in "%Y-%m-%d %H:%M:%S" format.
+    """
+    # Format to the second
+    label = np.datetime_as_string(data_tim, unit="s")
+
+    # Return label with a space separator
+    if np.ndim(label):
+        return np.char.replace(label, "T", " ")
+    return str(label).replace("T", " ")
+
+
+# Time key generator
+def time_key(data_time_point):
+    """
+    Parameters
+    ----------
+    data_time_point : string, datetime64 or array
+        Time value or array of time values.
+
+    Returns
+    -------
+    key : int64 or array
+        Epoch milliseconds of the time values.
+    """
+    # Return int64 view of millisecond datetime
+    return np.asarray(data_time_point, dtype="datetime64[ms]").view(np.int64)
+
+
+# %% Time index
+# Sorted time index
+class TimeIndex:
+    """
+    Sorted int64 time index of one instrument, built once and shared by
+    every stage that locates a time.
+
+    Parameters
+    ----------
+    data_tim : array
+        Time array in datetime64.
+    """
+
+    def __init__(self, data_tim):
+        # Time array and int64 key repo
+        self.tim = np.asarray(data_tim)
+        key = time_key(self.tim)
+
+        # Keep a sort order only for unsorted time arrays
+        self.order = (
+            None
+            if np.all(key[1:] >= key[:-1])
+            else np.argsort(key, kind="stable")
+        )
+        self.key = key if self.order is None else key[self.order]
+
+    def __len__(self):
+        # Return number of time entries
+        return len(self.tim)
+
+    def __getitem__(self, idx):
+        # Return time array entries for labels and slicing
+        return self.tim[idx]
+
+    def rows(self, pos):
+        """
+        Parameters
+        ----------
+        pos : integer or array
+            Positions in the sorted key array, -1 for missing.
+
+        Returns
+        -------
+        idx : integer or array
+            Time array row indices, -1 for missing.
+        """
+        # Map sorted positions back to time array rows
+        if self.order is None:
+            return pos
+        return np.where(np.asarray(pos) < 0, -1, self.order[pos])
+
+    def exact(self, data_time_point):
+        """
+        Parameters
+        ----------
+        data_time_point : string, datetime64 or array
+            Time values to locate exactly.
+
+        Returns
+        -------
+        idx : integer or array
+            Time array row indices, -1 where no exact match exists.
+        """
+        # Binary search on sorted keys, nothing matches an empty index
+        query = time_key(data_time_point)
+        if not len(self.key):
+            return np.full(np.shape(query), -1)[()]
+        pos = np.searchsorted(self.key, query)
+        pos_clip = np.minimum(pos, len(self.key) - 1)
+
+        # Return matched rows
+        return self.rows(np.where(self.key[pos_clip] == query, pos_clip, -1))
+
+    def nearest(self, data_time_point):
+        """
+        Parameters
+        ----------
+        data_time_point : string, datetime64 or array
+            Time values to locate.
+
+        Returns
+        -------
+        idx : integer or array
+            Time array row indices of the nearest time entries, -1 for an
+            empty index.
+        """
+        # Short indices have no neighbouring keys to compare
+        query = time_key(data_time_point)
+        if len(self.key) < 2:
+            return np.full(np.shape(query), len(self.key) - 1)[()]
+
+        # Binary search and compare the neighbouring keys
+        pos = np.clip(np.searchsorted(self.key, query), 1, len(self.key) - 1)
+        pos = np.where(
+            np.abs(self.key[pos - 1] - query) <= np.abs(self.key[pos] - query),
+            pos - 1,
+            pos,
+        )
+
+        # Return nearest rows
+        return self.rows(pos)
+
+    def within(self, data_time_point, resolution=1000):
+        """
+        Parameters
+        ----------
+        data_time_point : string, datetime64 or array
+            Time values to locate.
+        resolution : integer, optional
+            Matching window in ms. The default is 1000.
+
+        Returns
+        -------
+        idx : integer or array
+            Time array row indices of the first entry within
+            [time, time + resolution), -1 where no entry exists.
+        """
+        # Binary search for the first key at or after the time value,
+        # nothing matches an empty index
+        query = time_key(data_time_point)
+        if not len(self.key):
+            return np.full(np.shape(query), -1)[()]
+        pos = np.searchsorted(self.key, query)
+        pos_clip = np.minimum(pos, len(self.key) - 1)
+
+        # Return rows inside the window
+        return self.rows(
+            np.where(
+                (pos < len(self.key))
+                & (self.key[pos_clip] < query + resolution),
+                pos_clip,
+                -1,
+            )
+        )
+
+    def range(self, data_time_start, data_time_stop):
+        """
+        Parameters
+        ----------
+        data_time_start : string or datetime64
+            Start of the time range, inclusive.
+        data_time_stop : string or datetime64
+            Stop of the time range, exclusive.
+
+        Returns
+        -------
+        idx : slice or array
+            Time array rows inside the range, a slice for sorted arrays.
+        """
+        # Binary search for both range edges
+        pos_start, pos_stop = np.searchsorted(
+            self.key, time_key([data_time_start, data_time_stop])
+        )
+
+        # Return rows inside the range
+        if self.order is None:
+            return slice(int(pos_start), int(pos_stop))
+        return np.sort(self.order[pos_start:pos_stop])
+
+    def locate(self, data_time_point):
+        """
+        Parameters
+        ----------
+        data_time_point : string or datetime64
+            Time point to locate, matched to the second.
+
+        Returns
+        -------
+        idx : integer
+            Index of the first time array entry within that second.
+        """
+        # Match to the second as the time labels do
+        idx = int(self.within(np.datetime64(data_time_point, "s")))
+        if idx < 0:
+            raise IndexError(f"Time {data_time_point} not in time index")
+
+        # Return located row
+        return idx
+
+
+# Time index generator
+def time_index(data_tim):
+    """
+    Parameters
+    ----------
+    data_tim : array or TimeIndex
+        Time array in datetime64, or an already built time index.
+
+    Returns
+    -------
+    index : TimeIndex
+        Shared time index of the time array.
+    """
+    # Reuse built indices
+    if isinstance(data_tim, TimeIndex):
+        return data_tim
+
+    # Return new time index
+    return TimeIndex(data_tim)
+
+
+# %% Dtype policy
+# Pipeline dtype policy repo - flux and validity dtype, time is always
+# datetime64[ms] backed by int64
+DTYPE_POLICY = {
+    "default": {"flux": np.float64, "mvd": int},
+    "compact": {"flux": np.float32, "mvd": np.uint8},
+    "packed": {"flux": np.float32, "mvd": "packed"},
+}
+
+
+# Dtype policy getter
+def dtype_policy(policy="default"):
+    """
+    Parameters
+    ----------
+    policy : string or dict, optional
+        Name of a DTYPE_POLICY entry, or a custom policy dict.
+        The default is "default".
+
+    Returns
+    -------
+    policy : dict
+        Flux and validity dtype of the policy.
+    """
+    # Keep custom policy dicts
+    if isinstance(policy, dict):
+        return policy
+    if policy not in DTYPE_POLICY:
+        raise ValueError(f"Unknown dtype policy: {policy}")
+
+    # Return named policy
+    return DTYPE_POLICY[policy]
+
+
 # %% Data parser
 # CSV data parser
-def csv_loader(file_path, dtype=float):
+def csv_loader(file_path, dtype=float, cache=None):
     """
     Parameters
     ----------
     file_path : string
         Path to data file folder.
     dtype : dtype, optional
-        The dtype of assigned file. The default is float.
+        The dtype of assigned file, or "packed" for bit-packed validity
+        rows. The default is float.
+    cache : bool or None, optional
+        Read and write the binary cache sidecar. The default is None, which
+        caches plain files only, sniffed from the magic bytes, so compressed
+        inputs are never expanded back onto disk.
 
     Returns
     -------
@@ -27,27 +570,244 @@ def csv_loader(file_path, dtype=float):
         The data readout array.
 
     """
-    # Initial CSV data load with specified dtype
-    data = np.loadtxt(file_path, delimiter=",", dtype=dtype)
+    # Bit-packed validity rows from a uint8 parse
+    if isinstance(dtype, str) and dtype == "packed":
+        return np.packbits(csv_loader(file_path, np.uint8, cache), axis=1)
+
+    # Resolve plain or compressed data file
+    file_path = file_resolver(file_path)
+    if cache is None:
+        cache = file_compression(file_path) is None
+
+    # Cached data load, parse CSV data with specified dtype on cache miss
+    data = cache_reader(file_path, dtype) if cache else None
+    if data is None:
+        with file_opener(file_path, "rt") as file:
+            data = np.loadtxt(file, delimiter=",", dtype=dtype)
+        if cache:
+            cache_writer(file_path, dtype, data)
 
     # Time data loader and convertor
     if dtype == np.uint64:
-        # Define start point of datetime at 1979-01-01 as day01
-        time_origin = dt.datetime(1979, 1, 1) - dt.timedelta(days=1)
-
-        # Construct time function for calculating time result
-        time_update = [
-            time_origin + dt.timedelta(milliseconds=ms + days * 86400000)
-            for ms, days in data  # col0, col1: ms, days
-        ]
-
-        # Combined datetime data
-        data = np.array(
-            [time.strftime("%Y-%m-%d %H:%M:%S") for time in time_update]
-        )
-
         # Return converted time data array
-        return data
+        return time_decoder(data)
 
     # Data loader for all other dtype
     return data
+
+
+# %% Streaming data parser
+# Row-wise CSV data streamer
+def csv_streamer(file_path, chunk_size, dtype=float):
+    """
+    Parameters
+    ----------
+    file_path : string
+        Path to data file.
+    chunk_size : integer
+        Maximum number of rows per yielded block.
+    dtype : dtype, optional
+        The dtype of assigned file. The default is float.
+
+    Yields
+    ------
+    data : array
+        The data readout block of at most chunk_size rows.
+    """
+    # Parse the file chunk_size lines at a time
+    with file_opener(file_path, "rt") as file:
+        while True:
+            lines = list(itertools.islice(file, chunk_size))
+            if not lines:
+                break
+            data = np.loadtxt(lines, delimiter=",", dtype=dtype, ndmin=2)
+
+            # Yield converted time block for time data
+            yield time_decoder(data) if dtype == np.uint64 else data
+
+
+# Column-wise CSV data streamer for transposed files
+def csv_column_streamer(file_path, chunk_size, dtype=float, block_size=65536):
+    """
+    Parameters
+    ----------
+    file_path : string
+        Path to transposed data file, one row per channel.
+    chunk_size : integer
+        Maximum number of columns per yielded block.
+    dtype : dtype, optional
+        The dtype of assigned file. The default is float.
+    block_size : integer, optional
+        Bytes read per file access. The default is 65536.
+
+    Yields
+    ------
+    data : array
+        Transposed data readout block of shape (chunk_size, rows).
+    """
+    # Locate row boundaries in a single pass of fixed size blocks
+    bounds, pos = [0], 0
+    with file_opener(file_path) as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            bounds.extend(
+                pos + i + 1
+                for i in np.flatnonzero(np.frombuffer(block, np.uint8) == 10)
+            )
+            pos += len(block)
+    if bounds[-1] != pos:
+        bounds.append(pos)
+
+    # Single row token streamer
+    def row_streamer(start, end):
+        with file_opener(file_path) as file:
+            file.seek(start)
+            tokens, rest, left = [], b"", end - start
+            while left > 0 or rest:
+                # Read next block and keep the trailing partial token
+                block = file.read(min(block_size, left)) if left > 0 else b""
+                left -= len(block)
+                parts = (rest + block).split(b",")
+                rest = parts.pop() if left > 0 else b""
+                tokens.extend(part.strip() for part in parts if part.strip())
+
+                # Yield parsed tokens in chunk_size runs
+                while len(tokens) >= chunk_size or (tokens and left <= 0):
+                    yield np.array(tokens[:chunk_size]).astype(dtype)
+                    del tokens[:chunk_size]
+
+    # Stack aligned row chunks into time-major blocks
+    rows = [
+        row_streamer(start, end)
+        for start, end in zip(bounds[:-1], bounds[1:])
+        if end - start > 1
+    ]
+    for chunks in zip(*rows):
+        yield np.stack(chunks, axis=1)
+
+
+# %% RSTN fixed-width parser
+# RSTN daily record layout - field: (start, width)
+SRS_LAYOUT = {
+    "station": (0, 4),
+    "year": (4, 2),
+    "month": (6, 2),
+    "day": (8, 2),
+    "hour": (10, 2),
+    "minute": (12, 2),
+    "second": (14, 2),
+    "flux": (16, 6),  # 8 consecutive I6 fields, one per freq
+}
+
+# RSTN fixed frequencies in GHz
+SRS_FREQ = np.array([0.245, 0.41, 0.61, 1.415, 2.695, 4.995, 8.8, 15.4])
+
+# RSTN record width up to the last flux field
+SRS_WIDTH = SRS_LAYOUT["flux"][0] + len(SRS_FREQ) * SRS_LAYOUT["flux"][1]
+
+
+# Fixed-width integer field parser
+def srs_field(data_bytes, start, width, blank=0):
+    """
+    Parameters
+    ----------
+    data_bytes : array
+        Record byte matrix of shape (records, line length).
+    start : integer
+        Field start column.
+    width : integer
+        Field width.
+    blank : float, optional
+        Value of fields without any digit. The default is 0.
+
+    Returns
+    -------
+    data : array
+        Parsed field values, int64 unless blank is a float.
+    """
+    # Digit values with blanks and signs as zero
+    field = data_bytes[:, start : start + width]
+    digits = field.astype(np.int64) - ord("0")
+    is_digit = (digits >= 0) & (digits <= 9)
+    digits = np.where(is_digit, digits, 0)
+
+    # Positional sum over the right aligned digits
+    data = digits @ (10 ** np.arange(width - 1, -1, -1, dtype=np.int64))
+
+    # Return signed field values, fields without digits as blank
+    data = np.where(np.any(field == ord("-"), axis=1), -data, data)
+    return np.where(np.any(is_digit, axis=1), data, blank)
+
+
+# RSTN fixed-width file parser
+def srs_loader(file_path):
+    """
+    Parameters
+    ----------
+    file_path : string
+        Path to RSTN fixed-width daily text file.
+
+    Returns
+    -------
+    data_fi : array
+        Flux array of shape (records, freq).
+    data_freq : array
+        Freq array in GHz.
+    data_tim : array
+        Time array in datetime64[ms].
+    """
+    # Read raw bytes, a trailing blank keeps gathered offsets in range
+    with file_opener(file_path) as file:
+        data_buf = np.frombuffer(file.read() + b" ", dtype=np.uint8)
+
+    # Line bounds from the newline offsets, without carriage returns
+    data_nl = np.flatnonzero(data_buf == ord("\n"))
+    line_start = np.concatenate([[0], data_nl + 1])
+    line_end = np.concatenate([data_nl, [len(data_buf) - 1]])
+    line_end = line_end - (
+        (line_end > line_start) & (data_buf[line_end - 1] == ord("\r"))
+    )
+
+    # Gather a blank padded byte matrix of the record width, so lines with
+    # missing or extra trailing blanks still line up
+    col = np.arange(SRS_WIDTH)
+    data_bytes = np.where(
+        col < (line_end - line_start)[:, None],
+        data_buf[np.minimum(line_start[:, None] + col, len(data_buf) - 1)],
+        ord(" "),
+    ).astype(np.uint8)
+
+    # Keep records with a complete time stamp, dropping blank lines
+    start = SRS_LAYOUT["year"][0]
+    data_stamp = data_bytes[:, start : SRS_LAYOUT["flux"][0]]
+    data_bytes = data_bytes[
+        np.all((data_stamp >= ord("0")) & (data_stamp <= ord("9")), axis=1)
+    ]
+
+    # Flux field parser over the consecutive freq columns
+    start, width = SRS_LAYOUT["flux"]
+    data_fi = np.stack(
+        [
+            srs_field(data_bytes, start + i * width, width, np.nan)
+            for i in range(len(SRS_FREQ))
+        ],
+        axis=1,
+    ).astype(float)
+
+    # Time field parser, two digit years pivot at 1950
+    year, month, day, hour, minute, second = [
+        srs_field(data_bytes, *SRS_LAYOUT[name])
+        for name in ("year", "month", "day", "hour", "minute", "second")
+    ]
+    year = np.where(year < 50, year + 2000, year + 1900)
+    data_tim = (
+        ((year - 1970) * 12 + month - 1)
+        .astype("datetime64[M]")
+        .astype("datetime64[ms]")
+        + (day - 1) * 86400000
+        + hour * 3600000
+        + minute * 60000
+        + second * 1000
+    )
+
+    # Return RSTN flux, freq, and time arrays
+    return (data_fi, SRS_FREQ.copy(), data_tim)
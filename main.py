@@ -10,6 +10,9 @@ Created on Wed Mar 15 2023
 # Data handler import
 from data_handler import loader, validator, quiet_sun, collector
 
+# Data reader import
+from data_reader import time_index
+
 # Data plotter import
 from data_plotter import plot_generator, log_avg_plotter
 
@@ -42,6 +45,13 @@ data_repo = loader(data_path)
 # %% NoRP validity filter result deposit
 norp_tim_valid, norp_fi_valid = validator(norp_mvd, norp_tim, norp_fi)
 
+# %% Time index generation - built once and shared by all stages
+norp_tim_valid, apl_tim, phf_tim = (
+    time_index(norp_tim_valid),
+    time_index(apl_tim),
+    time_index(phf_tim),
+)
+
 # %% NoRP quiet sun result deposit
 # Generate data array tuple
 quiet_sun_data = (norp_fi_valid, apl_fi, phf_fi)